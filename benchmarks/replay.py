@@ -0,0 +1,43 @@
+"""
+Replays an input recording headless, as fast as possible.
+
+Sessions recorded with ``python jeu.py --record session.bin`` are played
+back without a window, each tick stepped with the seconds it was recorded
+with, then the ticks per second and the timings of each stage are printed.
+
+    python benchmarks/replay.py session.bin
+    python benchmarks/replay.py session.bin --profile-csv stages.csv
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "final"))
+
+from jeu import GameState, InputReplay, StageProfiler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an input recording without a window.")
+    parser.add_argument("recording", help="file written with jeu.py --record")
+    parser.add_argument("--profile-csv", metavar="PATH", help="write the timings of every tick's stages to a CSV file")
+    args = parser.parse_args()
+
+    replay = InputReplay(args.recording)
+    state = GameState(seed=replay.seed)
+    state.profiler = StageProfiler(csv_path=args.profile_csv)
+    state.setup()
+
+    start = time.perf_counter()
+    ticks = replay.run(state)
+    seconds = time.perf_counter() - start
+    state.profiler.close()
+
+    print(f"{len(replay.events)} events, {ticks} ticks in {seconds:.2f} s ({ticks / seconds:.0f} ticks/s)")
+    print(state)
+    print(state.profiler)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Scripted game scenarios run headless, with fixed seeds.
+
+Each scenario drives a GameState without a window and records how many
+ticks per second it runs, the garbage collections it caused and the peak
+memory of the process. It is then run a second time under tracemalloc,
+which is too slow to be timed, to record the most memory the run held on
+top of what it started with and the memory blocks still held at its end.
+Every scenario runs in a fresh process so their memory doesn't add up. The results are
+written to a JSON file which can be diffed between commits.
+
+    python benchmarks/scenarios.py
+    python benchmarks/scenarios.py boss --mobs 500 --output boss.json
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows, the peak memory is then not recorded
+    resource = None
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "final"))
+
+import arcade
+
+from jeu import MOB, SCREEN_HEIGHT, SCREEN_WIDTH, GameState
+
+# Keys the player walks with in turn, and how long each one is held
+WALK_KEYS = (arcade.key.Z, arcade.key.D, arcade.key.S, arcade.key.Q)
+WALK_TICKS = 30
+# Ticks between two epee strikes
+ATTACK_TICKS = 20
+
+
+def make_state(seed: int) -> GameState:
+    """Returns a set up game whose player can't die."""
+    state = GameState(seed=seed)
+    state.setup()
+    player = state.player_sprite
+    player.max_health = player.health = 10 ** 9
+    return state
+
+
+def walk(state: GameState, ticks: int) -> None:
+    """Walks the player in a square and strikes with the epee for some ticks."""
+    for tick in range(ticks):
+        if tick % WALK_TICKS == 0:
+            state.release(WALK_KEYS[(tick // WALK_TICKS - 1) % len(WALK_KEYS)])
+            state.press(WALK_KEYS[tick // WALK_TICKS % len(WALK_KEYS)])
+        if tick % ATTACK_TICKS == 0:
+            state.attack()
+        state.update()
+        state.sounds.clear()
+
+
+def walk_every_room(state: GameState, args):
+    """Enters every room in turn and walks around in it."""
+    names = state.room_graph.names
+    per_room = max(1, args.ticks // len(names))
+
+    def run():
+        for index in range(len(names)):
+            state.enter_room(index, SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2)
+            walk(state, per_room)
+        return per_room * len(names)
+
+    return run
+
+
+def boss(state: GameState, args):
+    """Fights in the boss room with extra mobs."""
+    room_index = state.room_graph.names.index("Boss")
+    room = state.rooms[room_index]
+    rng = state.random["benchmark"]
+    for _ in range(args.mobs):
+        mob = MOB(room.health_bars)
+        mob.position = rng.uniform(0, SCREEN_WIDTH), rng.uniform(0, SCREEN_HEIGHT)
+        room.mob_list.append(mob)
+        room.mobs.append(mob)
+        room.mob_grid.insert(mob)
+        mob.indicator_bar.follow()
+    state.enter_room(room_index, SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2)
+
+    def run():
+        walk(state, args.ticks)
+        return args.ticks
+
+    return run
+
+
+def bullet_storm(state: GameState, args):
+    """Fires a volley from around the window at the player on every tick."""
+    rng = state.random["benchmark"]
+    state.enter_room(state.room_graph.start, SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2)
+
+    def run():
+        for _ in range(args.ticks):
+            positions = [
+                (rng.uniform(0, SCREEN_WIDTH), rng.choice((0, SCREEN_HEIGHT)))
+                for _ in range(args.volley)
+            ]
+            state.bullet_pool.fire_volley(positions, state.player_sprite.position)
+            state.update()
+            state.sounds.clear()
+        return args.ticks
+
+    return run
+
+
+SCENARIOS = {
+    "rooms": walk_every_room,
+    "boss": boss,
+    "storm": bullet_storm,
+}
+
+
+def peak_rss() -> int:
+    """Returns the most memory the process ever used in kilobytes, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # In bytes on macOS, in kilobytes elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_scenario(name: str, args) -> dict:
+    """Sets up a scenario and returns its measures."""
+    state = make_state(args.seed)
+    run = SCENARIOS[name](state, args)
+
+    gc.collect()
+    collections = sum(generation["collections"] for generation in gc.get_stats())
+    start = time.perf_counter()
+    ticks = run()
+    seconds = time.perf_counter() - start
+
+    result = {
+        "ticks": ticks,
+        "seconds": round(seconds, 3),
+        "ticks_per_second": round(ticks / seconds, 1),
+        "gc_collections": sum(generation["collections"] for generation in gc.get_stats()) - collections,
+        "peak_rss_kb": peak_rss(),
+        "bullets_high_water": state.bullet_pool.high_water,
+        "mobs_alive": len(state.room.mob_list),
+    }
+    result.update(trace_scenario(name, args))
+    return result
+
+
+def trace_scenario(name: str, args) -> dict:
+    """
+    Runs a scenario again under tracemalloc. Returns the most memory the
+    run held above what it started with, which grows with the temporary
+    objects made each tick, and the memory blocks still held at its end.
+    """
+    state = make_state(args.seed)
+    run = SCENARIOS[name](state, args)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    start_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    return {
+        "traced_peak_kb": (peak - start_size) // 1024,
+        "live_blocks": sum(stat.count_diff for stat in after.compare_to(before, "filename")),
+    }
+
+
+def commit() -> str:
+    """Returns the commit of the working tree, or None outside of git."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the game headless through scripted scenarios.")
+    parser.add_argument("scenarios", nargs="*", help=f"any of {', '.join(SCENARIOS)}, default: all of them")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random streams")
+    parser.add_argument("--ticks", type=int, default=1200, help="ticks each scenario runs")
+    parser.add_argument("--mobs", type=int, default=200, help="mobs added to the boss room")
+    parser.add_argument("--volley", type=int, default=20, help="bullets fired on each tick of the storm")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file the results are written to")
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name!r}")
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for name in args.scenarios or SCENARIOS:
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(run_scenario, (name, args))
+        result = results[name]
+        print(f"{name:<8} {result['ticks_per_second']:>9.1f} ticks/s  {result['gc_collections']:>4} gc  "
+              f"peak {result['peak_rss_kb']} kB  traced peak +{result['traced_peak_kb']} kB  "
+              f"{result['live_blocks']:>7} live blocks")
+
+    report = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "arcade": arcade.__version__,
+        "settings": {"seed": args.seed, "ticks": args.ticks, "mobs": args.mobs, "volley": args.volley},
+        "scenarios": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
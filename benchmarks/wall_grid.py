@@ -0,0 +1,68 @@
+"""
+Player vs wall collision cost as rooms get denser.
+
+Fills rooms of growing size with walls on the tile grid and times the
+wall lookup around the player, with the WallGrid used by the game and
+with a scan of every wall.
+
+    python benchmarks/wall_grid.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "final"))
+
+import arcade
+
+from jeu import SPRITE_SIZE, WallGrid
+
+QUERIES = 2000
+
+
+def make_walls(columns: int, rows: int, density: float, rng: random.Random):
+    """Returns walls covering a fraction of a columns x rows tile grid."""
+    walls = []
+    for x in range(columns):
+        for y in range(rows):
+            if rng.random() < density:
+                wall = arcade.SpriteSolidColor(SPRITE_SIZE, SPRITE_SIZE, arcade.color.GRAY)
+                wall.left = x * SPRITE_SIZE
+                wall.bottom = y * SPRITE_SIZE
+                walls.append(wall)
+    return walls
+
+
+def time_queries(query, player, positions) -> float:
+    """Returns the mean time of one query in microseconds."""
+    start = time.perf_counter()
+    for position in positions:
+        player.position = position
+        query(player)
+    return (time.perf_counter() - start) / len(positions) * 1e6
+
+
+def main():
+    rng = random.Random(0)
+    player = arcade.SpriteSolidColor(52, 71, arcade.color.GREEN)
+
+    print(f"{'tiles':>8} {'walls':>6} {'grid (us)':>10} {'scan (us)':>10}")
+    for columns, rows in ((16, 12), (32, 24), (64, 48), (128, 96)):
+        walls = make_walls(columns, rows, 0.3, rng)
+        grid = WallGrid(walls)
+        positions = [
+            (rng.uniform(0, columns * SPRITE_SIZE), rng.uniform(0, rows * SPRITE_SIZE))
+            for _ in range(QUERIES)
+        ]
+
+        def scan(sprite):
+            return [wall for wall in walls if arcade.check_for_collision(sprite, wall)]
+
+        grid_time = time_queries(grid.collisions, player, positions)
+        scan_time = time_queries(scan, player, positions)
+        print(f"{columns * rows:>8} {len(walls):>6} {grid_time:>10.1f} {scan_time:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Asset registry for the game.
+
+Every texture is decoded once and the same arcade.Texture object is handed
+out to every Sprite and Room that asks for it.
+
+The wall and floor images are much bigger than the size they are drawn at.
+They can be baked to their on-screen size ahead of time with:
+
+    python assets.py build
+
+The registry then loads the baked files instead of the originals. A baked
+file is only used while its original has the content it was baked from,
+otherwise the original is loaded and a warning tells to bake again.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import shutil
+import warnings
+from typing import Dict, Iterable, Optional, Tuple
+
+import arcade
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Bump this when the way images are baked changes, old caches are then ignored
+BAKE_VERSION = 2
+BAKE_DIR = os.path.join(ASSET_DIR, "baked", f"v{BAKE_VERSION}")
+MANIFEST_NAME = "manifest.json"
+
+# Largest scale each wall image is drawn at (SPRITE_SCALING / 4, / 3 or / 6 in jeu.py)
+WALL_SCALES: Dict[str, float] = {
+    "space_station_wall.jpg": 0.5 / 3,
+    "space_station_wall2.jpg": 0.5 / 3,
+    "space_station_wall3.jpg": 0.5 / 4,
+    "space_station_wall4.png": 0.5 / 4,
+    "space_station_wall5.png": 0.5 / 4,
+    "space_station_wall6.png": 0.5 / 4,
+    "Boss_wall.png": 0.5 / 6,
+}
+
+# Floors are stretched over the whole window (SCREEN_WIDTH x SCREEN_HEIGHT in jeu.py)
+FLOOR_SIZE: Tuple[int, int] = (64 * 16, 64 * 12)
+FLOORS = (
+    "space_station_floor.jpg",
+    "space_station_floor_bonus.jpg",
+    "space_station_floor_trap.jpg",
+    "Boss_floor.png",
+)
+
+
+class TextureRegistry:
+    """
+    Loads each image file once and shares the resulting texture.
+    :param str base_dir: Directory used to resolve relative file names.
+    :param str baked_dir: Directory holding the images made by ``build``.
+    """
+
+    def __init__(self, base_dir: str = ASSET_DIR, baked_dir: str = BAKE_DIR) -> None:
+        self.base_dir: str = base_dir
+        self.baked_dir: str = baked_dir
+        self._textures: Dict[str, arcade.Texture] = {}
+        self._manifest: Optional[Dict[str, dict]] = None
+        # Name -> manifest entry of its baked image, or None if the original is used
+        self._baked: Dict[str, Optional[dict]] = {}
+        self.atlas: Optional[arcade.TextureAtlas] = None
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __repr__(self) -> str:
+        return f"<TextureRegistry (loaded={len(self._textures)}, hits={self.hits}, misses={self.misses})>"
+
+    def path(self, name: str) -> str:
+        """Returns the full path of an asset. Arcade resources are left untouched."""
+        if name.startswith(":") or os.path.isabs(name):
+            return name
+        return os.path.join(self.base_dir, name)
+
+    @property
+    def manifest(self) -> Dict[str, dict]:
+        """Returns the manifest of the baked images, or an empty one if there is none."""
+        if self._manifest is None:
+            self._manifest = read_manifest(self.baked_dir)
+        return self._manifest
+
+    def baked(self, name: str) -> Optional[dict]:
+        """
+        Returns the manifest entry of a file if its baked image is up to date.
+        The answer is worked out once per file and then kept.
+        """
+        if name in self._baked:
+            return self._baked[name]
+        entry = self.manifest.get(name)
+        if entry is not None:
+            if not os.path.exists(os.path.join(self.baked_dir, entry["file"])):
+                reason = "is missing"
+            elif entry["source"] != source_signature(self.path(name)):
+                reason = "was made from another version of the image"
+            else:
+                reason = None
+            if reason is not None:
+                warnings.warn(
+                    f"The baked image of {name} {reason}, the original is loaded instead. "
+                    f"Run 'python assets.py build' to bake it again."
+                )
+                entry = None
+        self._baked[name] = entry
+        return entry
+
+    def get(self, name: str) -> arcade.Texture:
+        """
+        Returns the shared texture for a file, loading it on first use.
+        The baked image is used when there is an up to date one.
+        """
+        path = self.path(name)
+        texture = self._textures.get(path)
+        if texture is None:
+            self.misses += 1
+            entry = self.baked(name)
+            if entry is not None:
+                texture = arcade.load_texture(os.path.join(self.baked_dir, entry["file"]))
+            else:
+                texture = arcade.load_texture(path)
+            self._textures[path] = texture
+        else:
+            self.hits += 1
+        return texture
+
+    def scale(self, name: str, scale: float) -> float:
+        """
+        Converts a scale meant for the original image to one for the loaded
+        texture. It is exact for the width only, as each side of a baked
+        image is rounded on its own.
+        """
+        entry = self.baked(name)
+        if entry is None:
+            return scale
+        return scale * entry["source_size"][0] / entry["size"][0]
+
+    def sprite(self, name: str, scale: float = 1) -> arcade.Sprite:
+        """
+        Creates a sprite which uses the shared texture of a file. It has the
+        size the original image has at that scale, baked or not.
+        """
+        sprite = arcade.Sprite(texture=self.get(name), scale=self.scale(name, scale))
+        entry = self.baked(name)
+        if entry is not None:
+            # Setting each side also rescales the hit box along it
+            sprite.width = entry["source_size"][0] * scale
+            sprite.height = entry["source_size"][1] * scale
+        return sprite
+
+    def build_atlas(self, names: Iterable[str]) -> arcade.TextureAtlas:
+        """
+        Packs the textures of the given files in one atlas. Sprite lists
+        created with ``atlas=textures.atlas`` all share it. Needs an active
+        window.
+        """
+        atlas_textures = [self.get(name) for name in names]
+        self.atlas = arcade.TextureAtlas.create_from_texture_sequence(atlas_textures)
+        return self.atlas
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of loaded files, cache hits and cache misses."""
+        return {"loaded": len(self._textures), "hits": self.hits, "misses": self.misses}
+
+    def clear(self) -> None:
+        """Forgets every texture, the manifest and the atlas and resets the counters."""
+        self._textures.clear()
+        self._manifest = None
+        self._baked.clear()
+        self.atlas = None
+        self.hits = 0
+        self.misses = 0
+
+
+def source_signature(path: str) -> str:
+    """
+    Returns the SHA-256 of a file, used to know if a baked image was made
+    from it. Unlike the modification time, it stays the same on a fresh
+    clone or checkout.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest(baked_dir: str = BAKE_DIR) -> Dict[str, dict]:
+    """Reads the manifest of a bake directory. Returns an empty one if it can't be used."""
+    try:
+        with open(os.path.join(baked_dir, MANIFEST_NAME)) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != BAKE_VERSION:
+        return {}
+    return manifest["files"]
+
+
+def target_size(name: str, size: Tuple[int, int]) -> Tuple[int, int]:
+    """Returns the on-screen size of an image, never bigger than the image itself."""
+    width, height = size
+    if name in FLOORS:
+        return min(width, FLOOR_SIZE[0]), min(height, FLOOR_SIZE[1])
+    scale = WALL_SCALES[name]
+    return max(1, math.ceil(width * scale)), max(1, math.ceil(height * scale))
+
+
+def build(base_dir: str = ASSET_DIR, baked_dir: str = BAKE_DIR, force: bool = False) -> Dict[str, dict]:
+    """
+    Resizes every wall and floor image to its on-screen size and writes them,
+    with a manifest, in the bake directory. Up to date images are skipped unless
+    force is set.
+    """
+    from PIL import Image
+
+    resample = getattr(Image, "Resampling", Image).LANCZOS
+    os.makedirs(baked_dir, exist_ok=True)
+    old = {} if force else read_manifest(baked_dir)
+    files = {}
+    for name in list(WALL_SCALES) + list(FLOORS):
+        path = os.path.join(base_dir, name)
+        signature = source_signature(path)
+        entry = old.get(name)
+        if entry is not None and entry["source"] == signature \
+                and os.path.exists(os.path.join(baked_dir, entry["file"])):
+            files[name] = entry
+            continue
+
+        with Image.open(path) as image:
+            source_size = image.size
+            size = target_size(name, source_size)
+            if size == source_size:
+                # Already at its on-screen size, the original is loaded as is
+                continue
+            baked = image.resize(size, resample)
+        file_name = os.path.basename(path)
+        baked.save(os.path.join(baked_dir, file_name), quality=90, optimize=True)
+        files[name] = {
+            "file": file_name,
+            "size": list(size),
+            "source_size": list(source_size),
+            "source": signature,
+        }
+        print(f"{name}: {source_size[0]}x{source_size[1]} -> {size[0]}x{size[1]}")
+
+    with open(os.path.join(baked_dir, MANIFEST_NAME), "w") as file:
+        json.dump({"version": BAKE_VERSION, "files": files}, file, indent=2)
+    return files
+
+
+def main():
+    """ Command line entry point """
+    parser = argparse.ArgumentParser(description="Bake the game textures to their on-screen size.")
+    parser.add_argument("command", choices=["build", "clean"])
+    parser.add_argument("--force", action="store_true", help="rebuild every image")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        files = build(force=args.force)
+        print(f"{len(files)} images in {BAKE_DIR}")
+    else:
+        shutil.rmtree(os.path.dirname(BAKE_DIR), ignore_errors=True)
+
+
+# Registry shared by the whole game
+textures = TextureRegistry()
+
+if __name__ == "__main__":
+    main()
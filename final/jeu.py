@@ -1,16 +1,35 @@
 import arcade
+import argparse
+import csv
 import os
+import json
 import math
-from typing import Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 import random
+import struct
+import threading
+import time
+import bisect
+import heapq
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import arcade.gui
 
+try:
+    import numpy as np
+except ImportError:
+    # Optional, the bullets are then moved one by one
+    np = None
+
 from arcade.resources import (
     image_female_person_idle,
     image_laser_blue01,
     image_zombie_idle,
 )
 
+from assets import textures
+
 SPRITE_SCALING = 0.5
 SPRITE_NATIVE_SIZE = 128
 SPRITE_SIZE = int(SPRITE_NATIVE_SIZE * SPRITE_SCALING)
@@ -24,9 +43,37 @@ BULLET_SPEED = 150
 SPRITE_SCALING_EPEE = 0.7
 EPEE_SPEED = 8
 BULLET_DAMAGE = 1
+# Enemy bullets made up front, the pool grows past this if needed
+BULLET_POOL_SIZE = 32
 ENEMY_ATTACK_COOLDOWN = 1
+# Each attack comes up to this many seconds earlier or later than the cooldown
+ENEMY_ATTACK_JITTER = 0.2
+# Most enemies allowed to fire on the same frame, the others fire next frame
+ENEMY_ATTACK_BUDGET = 8
 
 INDICATOR_BAR_OFFSET = 32
+# Number of built rooms kept in memory, the others are rebuilt when entered
+ROOM_CACHE_SIZE = 6
+# Build the rooms next to the current one in the background
+PREFETCH_ROOMS = True
+# Time the main thread may spend each frame finishing prefetched rooms
+PREFETCH_BUDGET = 0.004
+# Stages timed by the frame profiler (F2), in the order they run
+PROFILE_STAGES = (
+    "prefetch", "physics", "mob cleanup", "bar updates", "bullet collision",
+    "bullet spawn", "epee collision", "room transition",
+    "draw static", "draw mobs", "draw epee", "draw bullets", "draw bars", "draw player",
+)
+# Frames the profiler percentiles are computed over
+PROFILE_WINDOW = 300
+# Kinds of the recorded input events
+INPUT_KEY_PRESS = 0
+INPUT_KEY_RELEASE = 1
+INPUT_MOUSE_PRESS = 2
+INPUT_END = 3
+INPUT_TICK = 4
+# Seconds per tick when a replay has no recorded time for the tick
+REPLAY_TIMESTEP = 1 / 60
 PLAYER_HEALTH = 10
 ENEMY_HEALTH = 3
 
@@ -34,10 +81,29 @@ SCREEN_WIDTH = SPRITE_SIZE * 16
 SCREEN_HEIGHT = SPRITE_SIZE * 12
 SCREEN_TITLE = "Galactic strikeforce 2"
 
-Dir_bullet_droite = False
-Dir_bullet_gauche = False
-Dir_bullet_haut = False
-Dir_bullet_bas = False
+# The rooms of the map and their exits
+ROOM_GRAPH_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rooms.json")
+
+EPEE_IMAGE = ":resources:gui_basic_assets/items/sword_gold.png"
+
+# Every image drawn by the game, packed in one texture atlas
+ATLAS_FILES = [
+    "doom_slayer.png",
+    image_zombie_idle,
+    image_laser_blue01,
+    EPEE_IMAGE,
+    "space_station_floor.jpg",
+    "space_station_floor_bonus.jpg",
+    "space_station_floor_trap.jpg",
+    "Boss_floor.png",
+    "space_station_wall.jpg",
+    "space_station_wall2.jpg",
+    "space_station_wall3.jpg",
+    "space_station_wall4.png",
+    "space_station_wall5.png",
+    "space_station_wall6.png",
+    "Boss_wall.png",
+]
 
 def sprite_off_screen(
     sprite: arcade.Sprite,
@@ -52,37 +118,74 @@ def sprite_off_screen(
         or sprite.left > screen_width
     )
 
-class Player(arcade.Sprite):
-    def __init__(self, bar_list: arcade.SpriteList) -> None:
+def exit_side(sprite: arcade.Sprite) -> Optional[str]:
+    """Returns the side of the screen the sprite's center went past, if any."""
+    if sprite.center_y > SCREEN_HEIGHT:
+        return "top"
+    if sprite.center_y < 0:
+        return "bottom"
+    if sprite.center_x > SCREEN_WIDTH:
+        return "right"
+    if sprite.center_x < 0:
+        return "left"
+    return None
+
+class HealthSprite(arcade.Sprite):
+    """
+    Sprite with health and an indicator bar showing it. The bar's fullness
+    is refreshed when the health changes, its position when follow() finds
+    the sprite moved.
+    :param HealthBars health_bars: The bars the indicator bar is drawn with.
+    :param int max_health: The health the sprite starts with.
+    """
+
+    def __init__(self, health_bars: "HealthBars", max_health: int, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.max_health: int = max_health
+        self.indicator_bar: IndicatorBar = IndicatorBar(
+            self, health_bars, (self.center_x, self.center_y)
+        )
+        self._health: int = max_health
+
+    @property
+    def health(self) -> int:
+        """Returns the health of the sprite."""
+        return self._health
+
+    @health.setter
+    def health(self, new_health: int) -> None:
+        """Sets the health of the sprite and the fullness of its bar."""
+        if new_health != self._health:
+            self._health = new_health
+            self.indicator_bar.fullness = min(max(new_health / self.max_health, 0.0), 1.0)
+
+class Player(HealthSprite):
+    def __init__(self, health_bars: "HealthBars") -> None:
         super().__init__(
-            filename=os.path.join(os.path.dirname(__file__), "doom_slayer.png"),
+            health_bars,
+            PLAYER_HEALTH,
+            texture=textures.get("doom_slayer.png"),
             scale=SPRITE_SCALING_PLAYER,
         )
-        self.indicator_bar: IndicatorBar = IndicatorBar(
-            self, bar_list, (self.center_x, self.center_y)
-        )
-        self.health: int = PLAYER_HEALTH
 
     def update(self):
         """ Move the player """
         self.center_x += self.change_x
         self.center_y += self.change_y
 
-class MOB(arcade.Sprite):
-    def __init__(self, bar_list: arcade.SpriteList) -> None:
+class MOB(HealthSprite):
+    def __init__(self, health_bars: "HealthBars") -> None:
         super().__init__(
-            filename=image_zombie_idle,
+            health_bars,
+            ENEMY_HEALTH,
+            texture=textures.get(image_zombie_idle),
             scale= SPRITE_SCALING_ENEMY
         )
-        self.indicator_bar: IndicatorBarMob = IndicatorBarMob(
-            self, bar_list, (self.center_x, self.center_y)
-        )
-        self.health: int = ENEMY_HEALTH
 
 class Bullet(arcade.Sprite):
     def __init__(self) -> None:
         super().__init__(
-            filename=image_laser_blue01,
+            texture=textures.get(image_laser_blue01),
             scale=SPRITE_SCALING_BULLET,
         )
 
@@ -93,184 +196,438 @@ class Bullet(arcade.Sprite):
             self.center_y + self.change_y * delta_time,
         )
 
-class IndicatorBar:
+def aim(origins_x, origins_y, target: Tuple[float, float], speed: float = BULLET_SPEED):
     """
-    Represents a bar which can display information about a sprite.
-    :param Player owner: The owner of this indicator bar.
-    :param arcade.SpriteList sprite_list: The sprite list used to draw the indicator
-    bar components.
-    :param Tuple[float, float] position: The initial position of the bar.
-    :param arcade.Color full_color: The color of the bar.
-    :param arcade.Color background_color: The background color of the bar.
-    :param int width: The width of the bar.
-    :param int height: The height of the bar.
-    :param int border_size: The size of the bar's border.
+    Aims bullets fired from arrays of positions at a target. Returns the
+    arrays of their angles, in degrees between 0 and 360, and of their
+    velocities along x and y. Needs NumPy.
     """
+    angles = np.arctan2(target[1] - origins_y, target[0] - origins_x)
+    degrees = np.degrees(angles)
+    degrees[degrees < 0] += 360
+    return degrees, np.cos(angles) * speed, np.sin(angles) * speed
 
-    def __init__(
-        self,
-        owner: Player,
-        sprite_list: arcade.SpriteList,
-        position: Tuple[float, float] = (0, 0),
-        full_color: arcade.Color = arcade.color.GREEN,
-        background_color: arcade.Color = arcade.color.BLACK,
-        width: int = 100,
-        height: int = 4,
-        border_size: int = 4,
-    ) -> None:
-        # Store the reference to the owner and the sprite list
-        self.owner: Player = owner
-        self.sprite_list: arcade.SpriteList = sprite_list
+class BulletPool:
+    """
+    Recycles the enemy bullets. A bullet leaving the game is hidden and kept
+    in the sprite list, and the next shot reuses it instead of creating a
+    new sprite. The pool grows when every bullet is in use.
+
+    When NumPy is installed, the positions, velocities and extents of the
+    bullets are also kept in arrays indexed by ``bullet.slot``, so every bullet
+    is moved and checked against the screen edges in a few array operations.
+    :param arcade.SpriteList sprite_list: The sprite list used to draw the bullets.
+    :param int size: The number of bullets made up front.
+    """
 
-        # Set the needed size variables
-        self._box_width: int = width
-        self._box_height: int = height
-        self._half_box_width: int = self._box_width // 2
-        self._center_x: float = 0.0
-        self._center_y: float = 0.0
-        self._fullness: float = 0.0
-
-        # Create the boxes needed to represent the indicator bar
-        self._background_box: arcade.SpriteSolidColor = arcade.SpriteSolidColor(
-            self._box_width + border_size,
-            self._box_height + border_size,
-            background_color,
-        )
-        self._full_box: arcade.SpriteSolidColor = arcade.SpriteSolidColor(
-            self._box_width,
-            self._box_height,
-            full_color,
-        )
-        self.sprite_list.append(self._background_box)
-        self.sprite_list.append(self._full_box)
+    # Hidden bullets are parked here so the sprite list culls them
+    PARKING = (-1000, -1000)
 
-        # Set the fullness and position of the bar
-        self.fullness: float = 1.0
-        self.position: Tuple[float, float] = position
+    def __init__(self, sprite_list: arcade.SpriteList, size: int = BULLET_POOL_SIZE) -> None:
+        self.sprite_list: arcade.SpriteList = sprite_list
+        # Every bullet of the pool, a bullet's slot is its index here
+        self.bullets: List[Bullet] = []
+        # Bullets in use, a dict is used as an ordered set
+        self.active: Dict[Bullet, None] = {}
+        self._free: List[Bullet] = []
+        self.high_water: int = 0
+        # Frames counted by on_update and bullets in use summed over them
+        self.frames: int = 0
+        self.active_total: int = 0
+        if np is not None:
+            self.x = np.zeros(0)
+            self.y = np.zeros(0)
+            self.vx = np.zeros(0)
+            self.vy = np.zeros(0)
+            # Distance from the center to each side of the rotated hit box
+            self.top = np.zeros(0)
+            self.bottom = np.zeros(0)
+            self.left = np.zeros(0)
+            self.right = np.zeros(0)
+            self.alive = np.zeros(0, dtype=bool)
+        for _ in range(size):
+            self._grow()
 
     def __repr__(self) -> str:
-        return f"<IndicatorBar (Owner={self.owner})>"
+        return f"<BulletPool (size={self.size}, active={len(self.active)}, high_water={self.high_water})>"
 
-    @property
-    def background_box(self) -> arcade.SpriteSolidColor:
-        """Returns the background box of the indicator bar."""
-        return self._background_box
+    def __len__(self) -> int:
+        return len(self.active)
 
     @property
-    def full_box(self) -> arcade.SpriteSolidColor:
-        """Returns the full box of the indicator bar."""
-        return self._full_box
+    def size(self) -> int:
+        """Returns the number of bullets the pool holds, in use or not."""
+        return len(self.bullets)
+
+    def _grow(self) -> None:
+        bullet = Bullet()
+        bullet.slot = len(self.bullets)
+        if np is not None and bullet.slot >= len(self.alive):
+            self._resize(max(2 * len(self.alive), BULLET_POOL_SIZE))
+        self.bullets.append(bullet)
+        self._hide(bullet)
+        self.sprite_list.append(bullet)
+        self._free.append(bullet)
+
+    def _resize(self, capacity: int) -> None:
+        for name in ("x", "y", "vx", "vy", "top", "bottom", "left", "right", "alive"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _hide(self, bullet: Bullet) -> None:
+        bullet.visible = False
+        bullet.change_x = 0
+        bullet.change_y = 0
+        bullet.angle = 0
+        bullet.position = self.PARKING
+        if np is not None:
+            slot = bullet.slot
+            self.x[slot], self.y[slot] = self.PARKING
+            self.vx[slot] = self.vy[slot] = 0
+            self.alive[slot] = False
+
+    def acquire(self) -> Bullet:
+        """Returns a visible bullet ready to be placed and given a velocity."""
+        if not self._free:
+            self._grow()
+        bullet = self._free.pop()
+        bullet.visible = True
+        self.active[bullet] = None
+        self.high_water = max(self.high_water, len(self.active))
+        return bullet
+
+    def fire(
+        self, position: Tuple[float, float], angle: float, change_x: float, change_y: float
+    ) -> Bullet:
+        """Places a bullet from the pool and gives it its angle and velocity."""
+        bullet = self.acquire()
+        bullet.position = position
+        bullet.angle = angle
+        bullet.change_x = change_x
+        bullet.change_y = change_y
+        if np is not None:
+            slot = bullet.slot
+            self.x[slot], self.y[slot] = position
+            self.vx[slot] = change_x
+            self.vy[slot] = change_y
+            self._set_extents(np.array([slot]), np.array([angle]))
+            self.alive[slot] = True
+        return bullet
+
+    def fire_volley(
+        self, positions: List[Tuple[float, float]], target: Tuple[float, float], speed: float = BULLET_SPEED
+    ) -> List[Bullet]:
+        """
+        Fires one bullet from each position towards the target. With NumPy the
+        bullets are aimed and stored in the arrays all at once.
+        """
+        if np is None:
+            bullets = []
+            for position in positions:
+                angle = math.atan2(target[1] - position[1], target[0] - position[0])
+                angle_deg = math.degrees(angle)
+                if angle_deg < 0:
+                    angle_deg += 360
+                bullets.append(self.fire(position, angle_deg, math.cos(angle) * speed, math.sin(angle) * speed))
+            return bullets
+
+        if not positions:
+            return []
+        origins = np.array(positions, dtype=float)
+        angles, change_x, change_y = aim(origins[:, 0], origins[:, 1], target, speed)
+
+        bullets = [self.acquire() for _ in positions]
+        slots = np.array([bullet.slot for bullet in bullets])
+        self.x[slots] = origins[:, 0]
+        self.y[slots] = origins[:, 1]
+        self.vx[slots] = change_x
+        self.vy[slots] = change_y
+        self._set_extents(slots, angles)
+        self.alive[slots] = True
+
+        for bullet, position, angle, bullet_change_x, bullet_change_y in zip(
+            bullets, origins.tolist(), angles.tolist(), change_x.tolist(), change_y.tolist()
+        ):
+            bullet.position = position
+            bullet.angle = angle
+            bullet.change_x = bullet_change_x
+            bullet.change_y = bullet_change_y
+        return bullets
+
+    def _set_extents(self, slots, angles) -> None:
+        """Stores how far the rotated hit box of each bullet goes from its center."""
+        bullet = self.bullets[0]
+        points = np.array(bullet.hit_box, dtype=float) * bullet.scale
+        radians = np.radians(angles)[:, None]
+        cos = np.cos(radians)
+        sin = np.sin(radians)
+        points_x = points[:, 0] * cos - points[:, 1] * sin
+        points_y = points[:, 0] * sin + points[:, 1] * cos
+        self.right[slots] = points_x.max(axis=1)
+        self.left[slots] = -points_x.min(axis=1)
+        self.top[slots] = points_y.max(axis=1)
+        self.bottom[slots] = -points_y.min(axis=1)
+
+    def release(self, bullet: Bullet) -> None:
+        """Hides a bullet and gives it back to the pool."""
+        del self.active[bullet]
+        self._hide(bullet)
+        self._free.append(bullet)
 
-    @property
-    def fullness(self) -> float:
-        """Returns the fullness of the bar."""
-        return self._fullness
+    def on_update(self, delta_time: float = 1 / 60) -> None:
+        """Moves the bullets in use and gives back the ones that left the screen."""
+        self.frames += 1
+        self.active_total += len(self.active)
+        if np is None:
+            for bullet in list(self.active):
+                bullet.on_update(delta_time)
+                if sprite_off_screen(bullet):
+                    self.release(bullet)
+            return
+
+        count = len(self.bullets)
+        x = self.x[:count]
+        y = self.y[:count]
+        x += self.vx[:count] * delta_time
+        y += self.vy[:count] * delta_time
+        off_screen = self.alive[:count] & (
+            (y + self.top[:count] < 0)
+            | (y - self.bottom[:count] > SCREEN_HEIGHT)
+            | (x + self.right[:count] < 0)
+            | (x - self.left[:count] > SCREEN_WIDTH)
+        )
+        for slot in np.flatnonzero(off_screen).tolist():
+            self.release(self.bullets[slot])
 
-    @fullness.setter
-    def fullness(self, new_fullness: float) -> None:
-        """Sets the fullness of the bar."""
-        # Check if new_fullness if valid
-        if not (0.0 <= new_fullness <= 1.0):
-            raise ValueError(
-                f"Got {new_fullness}, but fullness must be between 0.0 and 1.0."
-            )
+        # Only the sprites still in use get their new position
+        slots = np.flatnonzero(self.alive[:count])
+        bullets = self.bullets
+        for slot, bullet_x, bullet_y in zip(slots.tolist(), x[slots].tolist(), y[slots].tolist()):
+            bullets[slot].position = (bullet_x, bullet_y)
 
-        # Set the size of the bar
-        self._fullness = new_fullness
-        if new_fullness == 0.0:
-            # Set the full_box to not be visible since it is not full anymore
-            self.full_box.visible = False
-        else:
-            # Set the full_box to be visible incase it wasn't then update the bar
-            self.full_box.visible = True
-            self.full_box.width = self._box_width * new_fullness
-            self.full_box.left = self._center_x - (self._box_width // 2)
+    def collide(self, sprite: arcade.Sprite) -> List[int]:
+        """
+        Returns the slots of the bullets in use which hit a sprite. The bounding
+        boxes of every bullet are first tested against the sprite's one, and
+        only the bullets which overlap it get a precise hit box check.
+        """
+        if np is None:
+            return [
+                bullet.slot for bullet in self.active
+                if arcade.check_for_collision(bullet, sprite)
+            ]
+
+        count = len(self.bullets)
+        x = self.x[:count]
+        y = self.y[:count]
+        overlap = self.alive[:count] & (
+            (x - self.left[:count] <= sprite.right)
+            & (x + self.right[:count] >= sprite.left)
+            & (y - self.bottom[:count] <= sprite.top)
+            & (y + self.top[:count] >= sprite.bottom)
+        )
+        return [
+            slot for slot in np.flatnonzero(overlap).tolist()
+            if arcade.check_for_collision(self.bullets[slot], sprite)
+        ]
 
     @property
-    def position(self) -> Tuple[float, float]:
-        """Returns the current position of the bar."""
-        return self._center_x, self._center_y
+    def average(self) -> float:
+        """Returns the average number of bullets in use per frame."""
+        return self.active_total / self.frames if self.frames else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the size of the pool and the bullets in use now, on average and at most."""
+        return {
+            "size": self.size,
+            "active": len(self.active),
+            "average": round(self.average, 1),
+            "high_water": self.high_water,
+        }
+
+class HealthBars:
+    """
+    Draws every indicator bar added to it in one instanced draw call. The
+    center and the fullness of each bar are kept in one flat array, which is
+    uploaded to the GPU in one go when the bars are drawn.
+    :param arcade.Color full_color: The color of the bars.
+    :param arcade.Color background_color: The background color of the bars.
+    :param int width: The width of a bar.
+    :param int height: The height of a bar.
+    :param int border_size: The size of a bar's border.
+    """
 
-    @position.setter
-    def position(self, new_position: Tuple[float, float]) -> None:
-        """Sets the new position of the bar."""
-        # Check if the position has changed. If so, change the bar's position
-        if new_position != self.position:
-            self._center_x, self._center_y = new_position
-            self.background_box.position = new_position
-            self.full_box.position = new_position
+    # Each bar is two quads, the background then the full part. Every vertex
+    # is a corner of its quad between (0, 0) and (1, 1), and which part it is.
+    _CORNERS = (
+        0, 0, 0,  1, 0, 0,  1, 1, 0,  0, 0, 0,  1, 1, 0,  0, 1, 0,
+        0, 0, 1,  1, 0, 1,  1, 1, 1,  0, 0, 1,  1, 1, 1,  0, 1, 1,
+    )
+    VERTEX_SHADER = """
+        #version 330
+
+        uniform Projection {
+            uniform mat4 matrix;
+        } proj;
+
+        uniform vec2 size;
+        uniform float border;
+        uniform vec4 full_color;
+        uniform vec4 background_color;
+
+        in vec2 in_corner;
+        in float in_part;
+        in vec2 in_center;
+        in float in_fullness;
+        out vec4 v_color;
+
+        void main() {
+            // The background is bigger by the border, the full part keeps its
+            // left side and shrinks with the fullness
+            vec2 box = size + vec2(border) * (1.0 - in_part);
+            float width = box.x * mix(1.0, in_fullness, in_part);
+            vec2 position = in_center - box / 2.0 + in_corner * vec2(width, box.y);
+            gl_Position = proj.matrix * vec4(position, 0.0, 1.0);
+            v_color = mix(background_color, full_color, in_part);
+        }
+    """
+    FRAGMENT_SHADER = """
+        #version 330
 
-            # Make sure full_box is to the left of the bar instead of the middle
-            self.full_box.left = self._center_x - (self._box_width // 2)
+        in vec4 v_color;
+        out vec4 out_color;
 
-class IndicatorBarMob:
-    """
-    Represents a bar which can display information about a sprite.
-    :param Player owner: The owner of this indicator bar.
-    :param arcade.SpriteList sprite_list: The sprite list used to draw the indicator
-    bar components.
-    :param Tuple[float, float] position: The initial position of the bar.
-    :param arcade.Color full_color: The color of the bar.
-    :param arcade.Color background_color: The background color of the bar.
-    :param int width: The width of the bar.
-    :param int height: The height of the bar.
-    :param int border_size: The size of the bar's border.
+        void main() {
+            out_color = v_color;
+        }
     """
 
+    # The program and the corners are the same for every set of bars
+    _program = None
+    _corners = None
+
     def __init__(
         self,
-        owner: MOB,
-        sprite_list: arcade.SpriteList,
-        position: Tuple[float, float] = (0, 0),
         full_color: arcade.Color = arcade.color.GREEN,
         background_color: arcade.Color = arcade.color.BLACK,
         width: int = 100,
         height: int = 4,
         border_size: int = 4,
     ) -> None:
-        # Store the reference to the owner and the sprite list
-        self.owner: MOB = owner
-        self.sprite_list: arcade.SpriteList = sprite_list
+        self.full_color: arcade.Color = full_color
+        self.background_color: arcade.Color = background_color
+        self.width: int = width
+        self.height: int = height
+        self.border_size: int = border_size
+        # The bar drawn by each instance, and its center x, center y and fullness
+        self.bars: List[IndicatorBar] = []
+        self.data = array("f")
+        # Bars refreshed since the last end_frame, and the totals over every frame
+        self.refreshed: int = 0
+        self.updates: int = 0
+        self.skipped: int = 0
+        self._buffer = None
+        self._geometry = None
 
-        # Set the needed size variables
-        self._box_width: int = width
-        self._box_height: int = height
-        self._half_box_width: int = self._box_width // 2
-        self._center_x: float = 0.0
-        self._center_y: float = 0.0
-        self._fullness: float = 0.0
-
-        # Create the boxes needed to represent the indicator bar
-        self._background_box: arcade.SpriteSolidColor = arcade.SpriteSolidColor(
-            self._box_width + border_size,
-            self._box_height + border_size,
-            background_color,
-        )
-        self._full_box: arcade.SpriteSolidColor = arcade.SpriteSolidColor(
-            self._box_width,
-            self._box_height,
-            full_color,
-        )
-        self.sprite_list.append(self._background_box)
-        self.sprite_list.append(self._full_box)
+    def __repr__(self) -> str:
+        return f"<HealthBars (bars={len(self.bars)}, updates={self.updates}, skipped={self.skipped})>"
+
+    def __len__(self) -> int:
+        return len(self.bars)
+
+    def add(self, bar: "IndicatorBar") -> None:
+        """Starts drawing a bar."""
+        bar.bars = self
+        bar.index = len(self.bars)
+        self.bars.append(bar)
+        self.data.extend((bar.position[0], bar.position[1], bar.fullness))
+
+    def remove(self, bar: "IndicatorBar") -> None:
+        """Stops drawing a bar. The last bar takes its place so the array stays packed."""
+        index = bar.index
+        last = self.bars.pop()
+        if last is not bar:
+            self.bars[index] = last
+            last.index = index
+            self.data[3 * index:3 * index + 3] = self.data[-3:]
+        del self.data[-3:]
+        bar.index = None
+
+    def end_frame(self) -> None:
+        """Counts the bars which weren't refreshed during the frame as skipped."""
+        self.updates += self.refreshed
+        self.skipped += max(len(self.bars) - self.refreshed, 0)
+        self.refreshed = 0
+
+    def _color(self, color: arcade.Color) -> Tuple[float, ...]:
+        if len(color) == 3:
+            color = (*color, 255)
+        return tuple(component / 255 for component in color)
+
+    def draw(self) -> None:
+        """Uploads the bars and draws them. Needs an active window."""
+        if not self.bars:
+            return
+        ctx = arcade.get_window().ctx
+        if HealthBars._program is None:
+            HealthBars._program = ctx.program(
+                vertex_shader=self.VERTEX_SHADER, fragment_shader=self.FRAGMENT_SHADER
+            )
+            HealthBars._corners = ctx.buffer(data=array("f", self._CORNERS))
+
+        size = len(self.data) * self.data.itemsize
+        if self._buffer is None or self._buffer.size < size:
+            # Grow to twice what is needed so adding a few bars doesn't reallocate
+            self._buffer = ctx.buffer(reserve=2 * size)
+            self._geometry = ctx.geometry([
+                arcade.gl.BufferDescription(HealthBars._corners, "2f 1f", ["in_corner", "in_part"]),
+                arcade.gl.BufferDescription(
+                    self._buffer, "2f 1f", ["in_center", "in_fullness"], instanced=True
+                ),
+            ], mode=ctx.TRIANGLES)
+        self._buffer.write(self.data)
+
+        program = HealthBars._program
+        program["size"] = self.width, self.height
+        program["border"] = self.border_size
+        program["full_color"] = self._color(self.full_color)
+        program["background_color"] = self._color(self.background_color)
+        self._geometry.render(program, instances=len(self.bars))
+
+    def release(self) -> None:
+        """Frees the GPU memory of the bars."""
+        self._geometry = None
+        self._buffer = None
+
+class IndicatorBar:
+    """
+    Represents a bar which can display information about a sprite. The bar
+    is drawn by the HealthBars it is added to.
+    :param owner: The owner of this indicator bar.
+    :param HealthBars bars: The bars this one is drawn with.
+    :param Tuple[float, float] position: The initial position of the bar.
+    """
+
+    def __init__(self, owner: arcade.Sprite, bars: HealthBars, position: Tuple[float, float] = (0, 0)) -> None:
+        # Store the reference to the owner
+        self.owner: arcade.Sprite = owner
 
         # Set the fullness and position of the bar
-        self.fullness: float = 1.0
-        self.position: Tuple[float, float] = position
+        self._center_x, self._center_y = position
+        self._fullness: float = 1.0
+        # Where the owner was when the bar last followed it
+        self._owner_position: Optional[Tuple[float, float]] = None
+
+        # Set by bars.add, the index of the bar in bars.data
+        self.bars: HealthBars = bars
+        self.index: Optional[int] = None
+        bars.add(self)
 
     def __repr__(self) -> str:
         return f"<IndicatorBar (Owner={self.owner})>"
 
-    @property
-    def background_box(self) -> arcade.SpriteSolidColor:
-        """Returns the background box of the indicator bar."""
-        return self._background_box
-
-    @property
-    def full_box(self) -> arcade.SpriteSolidColor:
-        """Returns the full box of the indicator bar."""
-        return self._full_box
-
     @property
     def fullness(self) -> float:
         """Returns the fullness of the bar."""
@@ -285,16 +642,10 @@ class IndicatorBarMob:
                 f"Got {new_fullness}, but fullness must be between 0.0 and 1.0."
             )
 
-        # Set the size of the bar
         self._fullness = new_fullness
-        if new_fullness == 0.0:
-            # Set the full_box to not be visible since it is not full anymore
-            self.full_box.visible = False
-        else:
-            # Set the full_box to be visible incase it wasn't then update the bar
-            self.full_box.visible = True
-            self.full_box.width = self._box_width * new_fullness
-            self.full_box.left = self._center_x - (self._box_width // 2)
+        if self.index is not None:
+            self.bars.data[3 * self.index + 2] = new_fullness
+            self.bars.refreshed += 1
 
     @property
     def position(self) -> Tuple[float, float]:
@@ -307,11 +658,334 @@ class IndicatorBarMob:
         # Check if the position has changed. If so, change the bar's position
         if new_position != self.position:
             self._center_x, self._center_y = new_position
-            self.background_box.position = new_position
-            self.full_box.position = new_position
+            if self.index is not None:
+                self.bars.data[3 * self.index:3 * self.index + 2] = array("f", new_position)
+                self.bars.refreshed += 1
+
+    def follow(self) -> None:
+        """Moves the bar above its owner, if the owner moved since the last call."""
+        owner_position = self.owner.position
+        if owner_position != self._owner_position:
+            self._owner_position = owner_position
+            self.position = owner_position[0], owner_position[1] + INDICATOR_BAR_OFFSET
+
+    def release(self) -> None:
+        """Stops drawing the bar."""
+        if self.index is not None:
+            self.bars.remove(self)
+
+class TileMap:
+    """
+    The walls of a room as a grid of tile ids, one byte per cell, with a
+    collision bitmap telling which cells a wall covers. Tile ids refer to
+    TileMap.types, 0 being an empty cell.
+    :param int columns: The width of the room in tiles.
+    :param int rows: The height of the room in tiles.
+    """
+
+    # (image file, scale) of each tile id
+    types: List[Optional[Tuple[str, float]]] = [None]
+    _type_ids: Dict[Tuple[str, float], int] = {}
+    # Rooms are built on the prefetch worker and on the main thread at the
+    # same time, the lock keeps them from giving two types the same id
+    _types_lock = threading.Lock()
+
+    def __init__(self, columns: int, rows: int) -> None:
+        self.columns: int = columns
+        self.rows: int = rows
+        self.tiles: bytearray = bytearray(columns * rows)
+        self.solid: bytearray = bytearray(columns * rows)
+
+    def __repr__(self) -> str:
+        return f"<TileMap ({self.columns}x{self.rows}, walls={self.columns * self.rows - self.tiles.count(0)})>"
+
+    @classmethod
+    def tile_id(cls, filename: str, scale: float) -> int:
+        """Returns the id of a tile type, registering it the first time."""
+        key = (filename, scale)
+        with cls._types_lock:
+            tile = cls._type_ids.get(key)
+            if tile is None:
+                if len(cls.types) > 255:
+                    raise ValueError("A tile map can't have more than 255 tile types.")
+                tile = len(cls.types)
+                cls.types.append(key)
+                cls._type_ids[key] = tile
+        return tile
+
+    def place(self, left: float, bottom: float, filename: str, scale: float) -> None:
+        """Puts a wall in the cell at the given pixel position."""
+        column = int(left // SPRITE_SIZE)
+        row = int(bottom // SPRITE_SIZE)
+        self.tiles[row * self.columns + column] = self.tile_id(filename, scale)
+
+    def may_collide(self, left: float, bottom: float, right: float, top: float) -> bool:
+        """
+        Returns True if a wall covers a cell the box overlaps or touches, or
+        if the box reaches out of the map, where walls bigger than a tile can
+        stick out. When it returns False, nothing in the box can collide
+        with a wall.
+        """
+        if left <= 0 or bottom <= 0 or right >= self.columns * SPRITE_SIZE or top >= self.rows * SPRITE_SIZE:
+            return True
+        # The cells on the other side of an edge the box lies on count too,
+        # since arcade finds a collision between sprites which only touch
+        first_column = math.ceil(left / SPRITE_SIZE) - 1
+        last_column = int(right // SPRITE_SIZE)
+        first_row = math.ceil(bottom / SPRITE_SIZE) - 1
+        last_row = int(top // SPRITE_SIZE)
+        solid = self.solid
+        for row in range(first_row, last_row + 1):
+            start = row * self.columns
+            if any(solid[start + first_column:start + last_column + 1]):
+                return True
+        return False
+
+    def build_walls(self, wall_list: arcade.SpriteList) -> None:
+        """Creates the wall sprites of the grid and marks the cells they cover."""
+        self.solid[:] = bytes(len(self.solid))
+        for index, tile in enumerate(self.tiles):
+            if not tile:
+                continue
+            filename, scale = self.types[tile]
+            wall = textures.sprite(filename, scale)
+            wall.left = (index % self.columns) * SPRITE_SIZE
+            wall.bottom = (index // self.columns) * SPRITE_SIZE
+            wall_list.append(wall)
+
+            # Some walls are bigger than a tile, mark every cell they cover
+            for row in range(int(wall.bottom // SPRITE_SIZE), min(math.ceil(wall.top / SPRITE_SIZE), self.rows)):
+                for column in range(int(wall.left // SPRITE_SIZE), min(math.ceil(wall.right / SPRITE_SIZE), self.columns)):
+                    self.solid[row * self.columns + column] = 1
+
+class WallGrid:
+    """
+    Uniform grid over the walls of a room, with one cell per tile. A wall
+    is put in every cell its bounding box covers.
+    :param walls: The walls to put in the grid.
+    :param int cell_size: The size of a cell in pixels.
+    """
+
+    def __init__(self, walls=(), cell_size: int = SPRITE_SIZE) -> None:
+        self.cell_size: int = cell_size
+        self.cells: Dict[Tuple[int, int], List[arcade.Sprite]] = {}
+        for wall in walls:
+            self.insert(wall)
+
+    def __repr__(self) -> str:
+        return f"<WallGrid (cells={len(self.cells)}, cell_size={self.cell_size})>"
+
+    def _covered_cells(self, sprite: arcade.Sprite):
+        size = self.cell_size
+        for x in range(int(sprite.left // size), math.ceil(sprite.right / size)):
+            for y in range(int(sprite.bottom // size), math.ceil(sprite.top / size)):
+                yield x, y
+
+    def insert(self, wall: arcade.Sprite) -> None:
+        """Adds a wall to the grid."""
+        for cell in self._covered_cells(wall):
+            self.cells.setdefault(cell, []).append(wall)
+
+    def remove(self, wall: arcade.Sprite) -> None:
+        """Removes a wall from the grid."""
+        for cell in self._covered_cells(wall):
+            self.cells[cell].remove(wall)
+
+    def nearby(self, sprite: arcade.Sprite) -> List[arcade.Sprite]:
+        """
+        Returns the walls in the 3x3 cells around the sprite's center. The
+        sprite must not be bigger than two cells in either direction.
+        """
+        size = self.cell_size
+        cell_x = int(sprite.center_x // size)
+        cell_y = int(sprite.center_y // size)
+        walls = []
+        for x in (cell_x - 1, cell_x, cell_x + 1):
+            for y in (cell_y - 1, cell_y, cell_y + 1):
+                for wall in self.cells.get((x, y), ()):
+                    if wall not in walls:
+                        walls.append(wall)
+        return walls
+
+    def collisions(self, sprite: arcade.Sprite) -> List[arcade.Sprite]:
+        """Returns the walls the sprite touches."""
+        return [wall for wall in self.nearby(sprite) if arcade.check_for_collision(sprite, wall)]
+
+class MobGrid(WallGrid):
+    """
+    Uniform grid over the mobs of a room. Mobs can move, so the grid
+    remembers the cells each mob is in, and move() puts a mob back in the
+    right cells after it moved.
+    :param mobs: The mobs to put in the grid.
+    :param int cell_size: The size of a cell in pixels.
+    """
 
-            # Make sure full_box is to the left of the bar instead of the middle
-            self.full_box.left = self._center_x - (self._box_width // 2)
+    def __init__(self, mobs=(), cell_size: int = SPRITE_SIZE) -> None:
+        self._mob_cells: Dict[arcade.Sprite, List[Tuple[int, int]]] = {}
+        super().__init__(mobs, cell_size)
+
+    def __repr__(self) -> str:
+        return f"<MobGrid (mobs={len(self._mob_cells)}, cells={len(self.cells)})>"
+
+    def __len__(self) -> int:
+        return len(self._mob_cells)
+
+    def insert(self, mob: arcade.Sprite) -> None:
+        """Adds a mob to the grid."""
+        cells = list(self._covered_cells(mob))
+        self._mob_cells[mob] = cells
+        for cell in cells:
+            self.cells.setdefault(cell, []).append(mob)
+
+    def remove(self, mob: arcade.Sprite) -> None:
+        """Removes a mob from the grid, wherever it was put."""
+        for cell in self._mob_cells.pop(mob, ()):
+            self.cells[cell].remove(mob)
+            if not self.cells[cell]:
+                del self.cells[cell]
+
+    def move(self, mob: arcade.Sprite) -> None:
+        """Updates the cells of a mob which moved. Nothing is done if they are the same."""
+        if list(self._covered_cells(mob)) != self._mob_cells.get(mob):
+            self.remove(mob)
+            self.insert(mob)
+
+class GridPhysicsEngine:
+    """
+    Moves the player against the walls like arcade.PhysicsEngineSimple does,
+    but only checks the walls a WallGrid finds around the player. With a tile
+    map, the walls aren't looked up at all while the player is away from
+    every wall cell of its collision bitmap.
+    :param arcade.Sprite player_sprite: The sprite to move.
+    :param WallGrid grid: The walls it can't go through.
+    :param TileMap tile_map: The tile map the walls were built from, if any.
+    """
+
+    def __init__(self, player_sprite: arcade.Sprite, grid: WallGrid, tile_map: Optional[TileMap] = None) -> None:
+        self.player_sprite: arcade.Sprite = player_sprite
+        self.grid: WallGrid = grid
+        self.tile_map: Optional[TileMap] = tile_map
+
+    def _collisions(self) -> List[arcade.Sprite]:
+        """Returns the walls the player touches."""
+        player = self.player_sprite
+        if self.tile_map is not None:
+            # The bounding box of the hit box, computed once instead of by
+            # each of left, bottom, right and top
+            points = player.get_adjusted_hit_box()
+            xs = [point[0] for point in points]
+            ys = [point[1] for point in points]
+            if not self.tile_map.may_collide(min(xs), min(ys), max(xs), max(ys)):
+                return []
+        return self.grid.collisions(player)
+
+    def _unstick(self) -> None:
+        """Moves the player out of the walls it starts in, trying further and further."""
+        player = self.player_sprite
+        original_x, original_y = player.center_x, player.center_y
+        vary = 1
+        while True:
+            for dx, dy in ((0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)):
+                player.center_x = original_x + dx * vary
+                player.center_y = original_y + dy * vary
+                if not self._collisions():
+                    return
+            vary *= 2
+
+    def update(self) -> List[arcade.Sprite]:
+        """
+        Move the player and resolve collisions.
+        :Returns: The walls the player touched.
+        """
+        player = self.player_sprite
+
+        if self._collisions():
+            self._unstick()
+
+        # --- Move in the y direction
+        player.center_y += player.change_y
+        hit_list = self._collisions()
+        if hit_list:
+            if player.change_y > 0:
+                while self._collisions():
+                    player.center_y -= 1
+            elif player.change_y < 0:
+                for wall in hit_list:
+                    while arcade.check_for_collision(player, wall):
+                        player.center_y += 0.25
+            player.change_y = 0
+        player.center_y = round(player.center_y, 2)
+
+        # --- Move in the x direction, as far as possible without touching a wall
+        if player.change_x:
+            original_x = player.center_x
+            direction = math.copysign(1, player.change_x)
+            upper_bound = abs(player.change_x)
+            lower_bound = 0
+            x_change = upper_bound
+            while True:
+                player.center_x = original_x + x_change * direction
+                collisions = self._collisions()
+                for wall in collisions:
+                    if wall not in hit_list:
+                        hit_list.append(wall)
+                if collisions:
+                    upper_bound = x_change - 1
+                    if upper_bound - lower_bound <= 0:
+                        x_change = lower_bound
+                        break
+                    x_change = (upper_bound + lower_bound) // 2
+                else:
+                    lower_bound = x_change
+                    if upper_bound - lower_bound <= 0:
+                        break
+                    x_change = (upper_bound + lower_bound) // 2 + (upper_bound + lower_bound) % 2
+            player.center_x = original_x + x_change * direction
+
+        return hit_list
+
+class StaticLayer:
+    """
+    Offscreen texture holding the parts of a room that never move (the floor
+    and the walls). It is drawn to the screen as one textured quad.
+    :param Tuple[int, int] size: The size of the layer in pixels.
+    """
+
+    # The quad and the shader program are the same for every layer
+    _quad = None
+    _program = None
+
+    def __init__(self, size: Tuple[int, int] = (SCREEN_WIDTH, SCREEN_HEIGHT)) -> None:
+        self.ctx = arcade.get_window().ctx
+        self.texture = self.ctx.texture(size, components=4)
+        self.framebuffer = self.ctx.framebuffer(color_attachments=[self.texture])
+
+        if StaticLayer._quad is None:
+            StaticLayer._quad = arcade.gl.geometry.quad_2d_fs()
+            StaticLayer._program = self.ctx.load_program(
+                vertex_shader=":resources:shaders/texture_default_projection_vs.glsl",
+                fragment_shader=":resources:shaders/texture_fs.glsl",
+            )
+
+    def render(self, *sprite_lists: arcade.SpriteList) -> None:
+        """Renders the sprite lists into the layer, replacing what it held."""
+        with self.framebuffer.activate() as fbo:
+            fbo.clear()
+            for sprite_list in sprite_lists:
+                sprite_list.draw()
+
+    def draw(self) -> None:
+        """Draws the layer over the whole window."""
+        self.texture.use(0)
+        # The layer is opaque, no need to blend it with what is under it
+        self.ctx.disable(self.ctx.BLEND)
+        StaticLayer._quad.render(StaticLayer._program)
+        self.ctx.enable(self.ctx.BLEND)
+
+    def release(self) -> None:
+        """Frees the GPU memory of the layer."""
+        self.framebuffer.delete()
+        self.texture.delete()
 
 class Room:
     """
@@ -320,70 +994,212 @@ class Room:
     """
     def __init__(self):
         # You may want many lists. Lists for coins, monsters, etc.
-        self.wall_list = None
+        # The walls are placed in the tile map by the setup_room_* functions,
+        # their sprites are then made by build_walls
+        self.tile_map = TileMap(SCREEN_WIDTH // SPRITE_SIZE, SCREEN_HEIGHT // SPRITE_SIZE)
+        self.wall_list = arcade.SpriteList(atlas=textures.atlas, lazy=True)
         self.mob = None
-        self.mob_list = arcade.SpriteList()
+        # The sprite lists are lazy so a room can be built on a worker
+        # thread, their GL buffers are made on the main thread
+        self.mob_list = arcade.SpriteList(atlas=textures.atlas, lazy=True)
+        # Every mob spawned in the room, dead ones included, in spawn order
+        self.mobs = []
+        # Indicator bars of the living mobs, only drawn while the player is here
+        self.health_bars = HealthBars()
+
+        # The floor is a sprite covering the window so it is drawn from
+        # the same texture atlas as everything else
+        self.floor_list = arcade.SpriteList(atlas=textures.atlas, lazy=True)
+        self._background = None
+
+        # The floor and the walls are rendered once in this layer. It is
+        # rendered again when static_dirty is set or the walls are added
+        # or removed.
+        self.static_layer = None
+        self.static_dirty = True
+        self._static_wall_count = 0
+
+        # Index of the walls, built once the room is set up
+        self.wall_grid = None
+        # Index of the living mobs, kept up to date by remove_mob
+        self.mob_grid = None
+        # Built on the first visit and reused afterwards
+        self.physics_engine = None
 
-        # This holds the background images. If you don't want changing
-        # background images, you can delete this part.
-        self.background = None
+    @property
+    def background(self) -> arcade.Texture:
+        """Returns the floor texture of the room."""
+        return self._background
+
+    @background.setter
+    def background(self, texture: arcade.Texture) -> None:
+        """Sets the floor texture of the room."""
+        self._background = texture
+        self.floor_list.clear()
+        floor = arcade.Sprite(texture=texture)
+        floor.width = SCREEN_WIDTH
+        floor.height = SCREEN_HEIGHT
+        floor.left = 0
+        floor.bottom = 0
+        self.floor_list.append(floor)
+        self.static_dirty = True
+
+    def build_walls(self) -> None:
+        """Creates the wall sprites from the tile map."""
+        self.wall_list.clear()
+        self.tile_map.build_walls(self.wall_list)
+        self.static_dirty = True
+
+    def gl_steps(self) -> List[Callable[[], None]]:
+        """
+        Returns the GL work of building the room split in steps: the buffers
+        of each sprite list, the static layer, then its render. They must run
+        in order on the main thread, but can run on different frames.
+        """
+        return [
+            self.floor_list.initialize,
+            self.wall_list.initialize,
+            self.mob_list.initialize,
+            self.create_static_layer,
+            self.prepare_static,
+        ]
+
+    def index_walls(self) -> None:
+        """Builds the grid used to find the walls near a sprite."""
+        self.wall_grid = WallGrid(self.wall_list)
+
+    def index_mobs(self) -> None:
+        """Builds the grid used to find the mobs near a sprite."""
+        self.mob_grid = MobGrid(self.mob_list)
+
+    def mobs_hit_by(self, sprite: arcade.Sprite) -> List[MOB]:
+        """Returns the living mobs the sprite touches."""
+        if self.mob_grid is None:
+            self.index_mobs()
+        return self.mob_grid.collisions(sprite)
+
+    def move_mob(self, mob: MOB) -> None:
+        """Updates the grid cells and the bar of a mob which moved."""
+        if self.mob_grid is not None:
+            self.mob_grid.move(mob)
+        mob.indicator_bar.follow()
+
+    def remove_mob(self, mob: MOB) -> None:
+        """Takes a dead mob out of the room. It stays in mobs."""
+        mob.remove_from_sprite_lists()
+        if self.mob_grid is not None:
+            self.mob_grid.remove(mob)
+
+    def physics_for(self, player: arcade.Sprite) -> GridPhysicsEngine:
+        """Returns the physics engine moving the player against the walls of this room."""
+        if self.physics_engine is None:
+            if self.wall_grid is None:
+                self.index_walls()
+            self.physics_engine = GridPhysicsEngine(player, self.wall_grid, self.tile_map)
+        return self.physics_engine
+
+    def create_static_layer(self) -> None:
+        """Creates the texture the floor and the walls are rendered in."""
+        if self.static_layer is None:
+            self.static_layer = StaticLayer()
+            self.static_dirty = True
+
+    def prepare_static(self) -> None:
+        """Renders the floor and the walls in the static layer if they changed."""
+        self.create_static_layer()
+
+        if self.static_dirty or len(self.wall_list) != self._static_wall_count:
+            self.static_layer.render(self.floor_list, self.wall_list)
+            self.static_dirty = False
+            self._static_wall_count = len(self.wall_list)
+
+    def draw_static(self) -> None:
+        """Draws the floor and the walls, rendering them again only if they changed."""
+        self.prepare_static()
+        self.static_layer.draw()
+
+    def release(self) -> None:
+        """Frees what the room holds. The room can't be used afterwards."""
+        self.health_bars.release()
+        if self.static_layer is not None:
+            self.static_layer.release()
+            self.static_layer = None
+        self.physics_engine = None
+        self.wall_grid = None
+        self.mob_grid = None
+        self.wall_list.clear()
+        self.mob_list.clear()
+        self.floor_list.clear()
 
-def setup_room_1():
+class DrawCounter:
+    """
+    Counts the draw calls of a frame and how many times they had to switch
+    to another texture atlas.
+    """
+    def __init__(self) -> None:
+        self.draw_calls: int = 0
+        self.texture_binds: int = 0
+        self._atlas = None
+
+    def __repr__(self) -> str:
+        return f"<DrawCounter (draw_calls={self.draw_calls}, texture_binds={self.texture_binds})>"
+
+    def reset(self) -> None:
+        """Starts counting a new frame."""
+        self.draw_calls = 0
+        self.texture_binds = 0
+        self._atlas = None
+
+    def draw(self, sprite_list: arcade.SpriteList) -> None:
+        """Draws a sprite list and counts it."""
+        self.count(sprite_list.atlas)
+        sprite_list.draw()
+
+    def count(self, texture) -> None:
+        """Counts a draw call made with the given texture or atlas, None if it has none."""
+        self.draw_calls += 1
+        if texture is not None and texture is not self._atlas:
+            self.texture_binds += 1
+            self._atlas = texture
+
+def setup_room_1(self, rng=random):
     """
     Create and return room 1.
     """
     room = Room()
 
-    # Sprite lists
-    room.wall_list = arcade.SpriteList()
-
     # -- Set up the walls
     # Create bottom and top row of boxes
     y = SCREEN_HEIGHT - SPRITE_SIZE
     for x in range(0, SCREEN_WIDTH, SPRITE_SIZE):
         if (x != SPRITE_SIZE * 6 and x != SPRITE_SIZE * 7) or y == 0:
-            wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall5.png"), SPRITE_SCALING/4)
-            wall.left = x
-            wall.bottom = y
-            room.wall_list.append(wall)
+            room.tile_map.place(x, y, "space_station_wall5.png", SPRITE_SCALING/4)
 
     y = 0
     for x in range(0, SCREEN_WIDTH, SPRITE_SIZE):
-        wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall3.jpg"), SPRITE_SCALING/4)
-        wall.left = x
-        wall.bottom = y
-        room.wall_list.append(wall)
+        room.tile_map.place(x, y, "space_station_wall3.jpg", SPRITE_SCALING/4)
 
     # Create left and right column of boxes
     x=0
     for y in range(SPRITE_SIZE, SCREEN_HEIGHT - SPRITE_SIZE, SPRITE_SIZE):
-        wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall6.png"), SPRITE_SCALING/4)
-        wall.left = x
-        wall.bottom = y
-        room.wall_list.append(wall)
+        room.tile_map.place(x, y, "space_station_wall6.png", SPRITE_SCALING/4)
 
     x = SCREEN_WIDTH - SPRITE_SIZE
     for y in range(SPRITE_SIZE, SCREEN_HEIGHT - SPRITE_SIZE, SPRITE_SIZE):
-        wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall4.png"), SPRITE_SCALING/4)
-        wall.left = x
-        wall.bottom = y
-        room.wall_list.append(wall)
+        room.tile_map.place(x, y, "space_station_wall4.png", SPRITE_SCALING/4)
 
     # Set the background image for this room
-    room.background = arcade.load_texture(os.path.join(os.path.dirname(__file__), "space_station_floor.jpg"))
+    room.background = textures.get("space_station_floor.jpg")
     
     return room
 
-def setup_room_2(self):
+def setup_room_2(self, rng=random):
     """
     Create and return room 2.
     """
     room = Room()
 
     """ Set up the game and initialize the variables. """
-    # Sprite lists
-    room.wall_list = arcade.SpriteList()
-
     # -- Set up the walls
     # Create bottom and top row of boxes
     # This y loops a list of two, the coordinate 0, and just under the top of window
@@ -392,10 +1208,7 @@ def setup_room_2(self):
         for x in range(0, SCREEN_WIDTH, SPRITE_SIZE):
             if (x != SPRITE_SIZE * 6 and x != SPRITE_SIZE * 7): 
                 # Skip making a block 6 and 7 blocks up and down
-                wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall3.jpg"), SPRITE_SCALING/4)
-                wall.left = x
-                wall.bottom = y
-                room.wall_list.append(wall)
+                room.tile_map.place(x, y, "space_station_wall3.jpg", SPRITE_SCALING/4)
 
     # Create left and right column of boxes
     for x in (0, SCREEN_WIDTH - SPRITE_SIZE):
@@ -403,34 +1216,25 @@ def setup_room_2(self):
         for y in range(SPRITE_SIZE, SCREEN_HEIGHT - SPRITE_SIZE, SPRITE_SIZE):
             if (y != SPRITE_SIZE * 4 and y != SPRITE_SIZE * 5) or x==0:
                 # Skip making a block 4 and 5 blocks on the right side
-                wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall6.png"), SPRITE_SCALING/4)
-                wall.left = x
-                wall.bottom = y
-                room.wall_list.append(wall)
+                room.tile_map.place(x, y, "space_station_wall6.png", SPRITE_SCALING/4)
             
-    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall.jpg"), SPRITE_SCALING/4)
-    wall.left = 7 * SPRITE_SIZE
-    wall.bottom = 4 * SPRITE_SIZE
-    room.wall_list.append(wall)
-    room.background = arcade.load_texture(os.path.join(os.path.dirname(__file__), "space_station_floor.jpg"))
+    room.tile_map.place(7 * SPRITE_SIZE, 4 * SPRITE_SIZE, "space_station_wall.jpg", SPRITE_SCALING/4)
+    room.background = textures.get("space_station_floor.jpg")
 
     for i in range(2): 
-        enemy = MOB(self.bar_list)
-        enemy.center_x = random.randrange(SCREEN_WIDTH)
-        enemy.center_y = random.randrange(SCREEN_HEIGHT)
+        enemy = MOB(room.health_bars)
+        enemy.center_x = rng.randrange(SCREEN_WIDTH)
+        enemy.center_y = rng.randrange(SCREEN_HEIGHT)
         room.mob_list.append(enemy)
     return room
 
-def setup_room_P1(self):
+def setup_room_P1(self, rng=random):
     """
     Create and return room P1.
     """
     room = Room()
 
     """ Set up the game and initialize the variables. """
-    # Sprite lists
-    room.wall_list = arcade.SpriteList()
-
     # -- Set up the walls
     # Create bottom and top row of boxes
     # This y loops a list of two, the coordinate 0, and just under the top of window
@@ -439,38 +1243,29 @@ def setup_room_P1(self):
         for x in range(0, SCREEN_WIDTH, SPRITE_SIZE):
             if (x != SPRITE_SIZE * 6 and x!= SPRITE_SIZE * 7) or y != 0:
                 # Skip making a block 6 and 7 blocks dawn
-                wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall3.jpg"), SPRITE_SCALING/4)
-                wall.left = x
-                wall.bottom = y
-                room.wall_list.append(wall)
+                room.tile_map.place(x, y, "space_station_wall3.jpg", SPRITE_SCALING/4)
 
     # Create left and right column of boxes
     for x in (0, SCREEN_WIDTH - SPRITE_SIZE):
         # Loop for each box going across
         for y in range(SPRITE_SIZE, SCREEN_HEIGHT - SPRITE_SIZE, SPRITE_SIZE):
-                wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall6.png"), SPRITE_SCALING/4)
-                wall.left = x
-                wall.bottom = y
-                room.wall_list.append(wall)
+                room.tile_map.place(x, y, "space_station_wall6.png", SPRITE_SCALING/4)
 
-    room.background = arcade.load_texture(os.path.join(os.path.dirname(__file__), "space_station_floor_trap.jpg"))
+    room.background = textures.get("space_station_floor_trap.jpg")
     for i in range(4): 
-        enemy = MOB(self.bar_list)
-        enemy.center_x = random.randrange(SCREEN_WIDTH)
-        enemy.center_y = random.randrange(SCREEN_HEIGHT)
+        enemy = MOB(room.health_bars)
+        enemy.center_x = rng.randrange(SCREEN_WIDTH)
+        enemy.center_y = rng.randrange(SCREEN_HEIGHT)
         room.mob_list.append(enemy)
     return room
 
-def setup_room_3(self):
+def setup_room_3(self, rng=random):
     """
     Create and return room 3.
     """
     room = Room()
 
     """ Set up the game and initialize the variables. """
-    # Sprite lists
-    room.wall_list = arcade.SpriteList()
-
     # -- Set up the walls
     # Create bottom and top row of boxes
     # This y loops a list of two, the coordinate 0, and just under the top of window
@@ -479,10 +1274,7 @@ def setup_room_3(self):
         for x in range(0, SCREEN_WIDTH, SPRITE_SIZE):
                 if (x != SPRITE_SIZE * 6 and x != SPRITE_SIZE * 7):
                     # Skip making a block 6 and 7 blocks up and down
-                    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall3.jpg"), SPRITE_SCALING/4)
-                    wall.left = x
-                    wall.bottom = y
-                    room.wall_list.append(wall)
+                    room.tile_map.place(x, y, "space_station_wall3.jpg", SPRITE_SCALING/4)
 
     # Create left and right column of boxes
     for x in (0, SCREEN_WIDTH - SPRITE_SIZE):
@@ -490,39 +1282,26 @@ def setup_room_3(self):
         for y in range(SPRITE_SIZE, SCREEN_HEIGHT - SPRITE_SIZE, SPRITE_SIZE):
             if (y != SPRITE_SIZE * 4 and y != SPRITE_SIZE * 5):
                 # Skip making a block 4 and 5 blocks up on the right and left side
-                wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall6.png"), SPRITE_SCALING/4)
-                wall.left = x
-                wall.bottom = y
-                room.wall_list.append(wall)
-
-    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall2.jpg"), SPRITE_SCALING/3)
-    wall.left = 5 * SPRITE_SIZE
-    wall.bottom = 5 * SPRITE_SIZE
-    room.wall_list.append(wall)
-
-    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall2.jpg"), SPRITE_SCALING/3)
-    wall.left = 7 * SPRITE_SIZE
-    wall.bottom = 5 * SPRITE_SIZE
-    room.wall_list.append(wall)
-
-    room.background = arcade.load_texture(os.path.join(os.path.dirname(__file__), "space_station_floor.jpg"))
+                room.tile_map.place(x, y, "space_station_wall6.png", SPRITE_SCALING/4)
+
+    room.tile_map.place(5 * SPRITE_SIZE, 5 * SPRITE_SIZE, "space_station_wall2.jpg", SPRITE_SCALING/3)
+    room.tile_map.place(7 * SPRITE_SIZE, 5 * SPRITE_SIZE, "space_station_wall2.jpg", SPRITE_SCALING/3)
+
+    room.background = textures.get("space_station_floor.jpg")
     for i in range(2): 
-        enemy = MOB(self.bar_list)
-        enemy.center_x = random.randrange(SCREEN_WIDTH)
-        enemy.center_y = random.randrange(SCREEN_HEIGHT)
+        enemy = MOB(room.health_bars)
+        enemy.center_x = rng.randrange(SCREEN_WIDTH)
+        enemy.center_y = rng.randrange(SCREEN_HEIGHT)
         room.mob_list.append(enemy)
     return room
 
-def setup_room_B1():
+def setup_room_B1(self, rng=random):
     """
     Create and return room B1.
     """
     room = Room()
 
     """ Set up the game and initialize the variables. """
-    # Sprite lists
-    room.wall_list = arcade.SpriteList()
-
     # -- Set up the walls
     # Create bottom and top row of boxes
     # This y loops a list of two, the coordinate 0, and just under the top of window
@@ -531,37 +1310,25 @@ def setup_room_B1():
         for x in range(0, SCREEN_WIDTH, SPRITE_SIZE):
             if (x != SPRITE_SIZE * 6 and x!= SPRITE_SIZE * 7)or y==0:
                 # Skip making a block 6 and 7 blocks up
-                wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall3.jpg"), SPRITE_SCALING/4)
-                wall.left = x
-                wall.bottom = y
-                room.wall_list.append(wall)
+                room.tile_map.place(x, y, "space_station_wall3.jpg", SPRITE_SCALING/4)
 
     # Create left and right column of boxes
     for x in (0, SCREEN_WIDTH - SPRITE_SIZE):
         # Loop for each box going across
         for y in range(SPRITE_SIZE, SCREEN_HEIGHT - SPRITE_SIZE, SPRITE_SIZE):
-                 wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall6.png"), SPRITE_SCALING/4)
-                 wall.left = x
-                 wall.bottom = y
-                 room.wall_list.append(wall)
-
-    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall2.jpg"), SPRITE_SCALING/3)
-    wall.left = 7 * SPRITE_SIZE
-    wall.bottom = 5 * SPRITE_SIZE
-    room.wall_list.append(wall)
-    room.background = arcade.load_texture(os.path.join(os.path.dirname(__file__), "space_station_floor_bonus.jpg"))
+                 room.tile_map.place(x, y, "space_station_wall6.png", SPRITE_SCALING/4)
+
+    room.tile_map.place(7 * SPRITE_SIZE, 5 * SPRITE_SIZE, "space_station_wall2.jpg", SPRITE_SCALING/3)
+    room.background = textures.get("space_station_floor_bonus.jpg")
     return room
     
-def setup_room_4(self):
+def setup_room_4(self, rng=random):
     """
     Create and return room 4.
     """
     room = Room()
 
     """ Set up the game and initialize the variables. """
-    # Sprite lists
-    room.wall_list = arcade.SpriteList()
-
     # -- Set up the walls
     # Create bottom and top row of boxes
     # This y loops a list of two, the coordinate 0, and just under the top of window
@@ -570,10 +1337,7 @@ def setup_room_4(self):
         for x in range(0, SCREEN_WIDTH, SPRITE_SIZE):
             if (x != SPRITE_SIZE * 2 and x!= SPRITE_SIZE * 3) or y==0:
                 # Skip making a block 2 and 3 blocks up
-                wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall3.jpg"), SPRITE_SCALING/4)
-                wall.left = x
-                wall.bottom = y
-                room.wall_list.append(wall)
+                room.tile_map.place(x, y, "space_station_wall3.jpg", SPRITE_SCALING/4)
 
     # Create left and right column of boxes
     for x in (0, SCREEN_WIDTH - SPRITE_SIZE):
@@ -581,54 +1345,34 @@ def setup_room_4(self):
         for y in range(SPRITE_SIZE, SCREEN_HEIGHT - SPRITE_SIZE, SPRITE_SIZE):
                 if (y != SPRITE_SIZE * 4 and y!= SPRITE_SIZE * 5) :
                     # Skip making a block 4 and 5 blocks on the right and left side
-                    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall6.png"), SPRITE_SCALING/4)
-                    wall.left = x
-                    wall.bottom = y
-                    room.wall_list.append(wall)
-
-    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall2.jpg"), SPRITE_SCALING/3)
-    wall.left = 5 * SPRITE_SIZE
-    wall.bottom = 5 * SPRITE_SIZE
-    room.wall_list.append(wall)
-
-    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall2.jpg"), SPRITE_SCALING/3)
-    wall.left = 5 * SPRITE_SIZE
-    wall.bottom = 6 * SPRITE_SIZE
-    room.wall_list.append(wall)
-
-    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall2.jpg"), SPRITE_SCALING/3)
-    wall.left = 5 * SPRITE_SIZE
-    wall.bottom = 7 * SPRITE_SIZE
-    room.wall_list.append(wall)
-    room.background = arcade.load_texture(os.path.join(os.path.dirname(__file__), "space_station_floor.jpg"))
+                    room.tile_map.place(x, y, "space_station_wall6.png", SPRITE_SCALING/4)
+
+    room.tile_map.place(5 * SPRITE_SIZE, 5 * SPRITE_SIZE, "space_station_wall2.jpg", SPRITE_SCALING/3)
+    room.tile_map.place(5 * SPRITE_SIZE, 6 * SPRITE_SIZE, "space_station_wall2.jpg", SPRITE_SCALING/3)
+    room.tile_map.place(5 * SPRITE_SIZE, 7 * SPRITE_SIZE, "space_station_wall2.jpg", SPRITE_SCALING/3)
+    room.background = textures.get("space_station_floor.jpg")
     
     for i in range(2): 
-        enemy = MOB(self.bar_list)
-        enemy.center_x = random.randrange(SCREEN_WIDTH)
-        enemy.center_y = random.randrange(SCREEN_HEIGHT)
+        enemy = MOB(room.health_bars)
+        enemy.center_x = rng.randrange(SCREEN_WIDTH)
+        enemy.center_y = rng.randrange(SCREEN_HEIGHT)
         room.mob_list.append(enemy)
     return room
 
-def setup_room_B2():
+def setup_room_B2(self, rng=random):
     """
     Create and return room B2.
     """
     room = Room()
 
     """ Set up the game and initialize the variables. """
-    # Sprite lists
-    room.wall_list = arcade.SpriteList()
-
     # -- Set up the walls
     # Create bottom and top row of boxes
     # This y loops a list of two, the coordinate 0, and just under the top of window
     for y in (0, SCREEN_HEIGHT - SPRITE_SIZE):
         # Loop for each box going across
         for x in range(0, SCREEN_WIDTH, SPRITE_SIZE):
-            wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall3.jpg"), SPRITE_SCALING/4)
-            wall.left = x
-            wall.bottom = y
-            room.wall_list.append(wall)
+            room.tile_map.place(x, y, "space_station_wall3.jpg", SPRITE_SCALING/4)
 
     # Create left and right column of boxes
     for x in (0, SCREEN_WIDTH - SPRITE_SIZE):
@@ -636,28 +1380,19 @@ def setup_room_B2():
         for y in range(SPRITE_SIZE, SCREEN_HEIGHT - SPRITE_SIZE, SPRITE_SIZE):
                 if (y != SPRITE_SIZE * 4 and y!= SPRITE_SIZE * 5)or x !=0:
                     # Skip making a block 4 and 5 blocks on the left side
-                    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall6.png"), SPRITE_SCALING/4)
-                    wall.left = x
-                    wall.bottom = y
-                    room.wall_list.append(wall)
-
-    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall2.jpg"), SPRITE_SCALING/3)
-    wall.left = 5 * SPRITE_SIZE
-    wall.bottom = 5 * SPRITE_SIZE
-    room.wall_list.append(wall)
-    room.background = arcade.load_texture(os.path.join(os.path.dirname(__file__), "space_station_floor_bonus.jpg"))
+                    room.tile_map.place(x, y, "space_station_wall6.png", SPRITE_SCALING/4)
+
+    room.tile_map.place(5 * SPRITE_SIZE, 5 * SPRITE_SIZE, "space_station_wall2.jpg", SPRITE_SCALING/3)
+    room.background = textures.get("space_station_floor_bonus.jpg")
     return room
 
-def setup_room_5(self):
+def setup_room_5(self, rng=random):
     """
     Create and return room 5.
     """
     room = Room()
 
     """ Set up the game and initialize the variables. """
-    # Sprite lists
-    room.wall_list = arcade.SpriteList()
-
     # -- Set up the walls
     # Create bottom and top row of boxes
     # This y loops a list of two, the coordinate 0, and just under the top of window
@@ -666,10 +1401,7 @@ def setup_room_5(self):
         for x in range(0, SCREEN_WIDTH, SPRITE_SIZE):
             if (x != SPRITE_SIZE * 2 and x!= SPRITE_SIZE * 3):
                 # Skip making a block 2 and 3 blocks up and down
-                wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall3.jpg"), SPRITE_SCALING/4)
-                wall.left = x
-                wall.bottom = y
-                room.wall_list.append(wall)
+                room.tile_map.place(x, y, "space_station_wall3.jpg", SPRITE_SCALING/4)
 
     # Create left and right column of boxes
     for x in (0, SCREEN_WIDTH - SPRITE_SIZE):
@@ -677,30 +1409,24 @@ def setup_room_5(self):
         for y in range(SPRITE_SIZE, SCREEN_HEIGHT - SPRITE_SIZE, SPRITE_SIZE):
                 if (y != SPRITE_SIZE * 6 and y!= SPRITE_SIZE * 7)or x!=0:
                     # Skip making a block 6 and 7 blocks on the left side
-                    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall6.png"), SPRITE_SCALING/4)
-                    wall.left = x
-                    wall.bottom = y
-                    room.wall_list.append(wall)
+                    room.tile_map.place(x, y, "space_station_wall6.png", SPRITE_SCALING/4)
 
-    room.background = arcade.load_texture(os.path.join(os.path.dirname(__file__), "space_station_floor.jpg"))
+    room.background = textures.get("space_station_floor.jpg")
 
     for i in range(2): 
-        enemy = MOB(self.bar_list)
-        enemy.center_x = random.randrange(SCREEN_WIDTH)
-        enemy.center_y = random.randrange(SCREEN_HEIGHT)
+        enemy = MOB(room.health_bars)
+        enemy.center_x = rng.randrange(SCREEN_WIDTH)
+        enemy.center_y = rng.randrange(SCREEN_HEIGHT)
         room.mob_list.append(enemy)
     return room
 
-def setup_room_P2(self):
+def setup_room_P2(self, rng=random):
     """
     Create and return room P2.
     """
     room = Room()
 
     """ Set up the game and initialize the variables. """
-    # Sprite lists
-    room.wall_list = arcade.SpriteList()
-
     # -- Set up the walls
     # Create bottom and top row of boxes
     # This y loops a list of two, the coordinate 0, and just under the top of window
@@ -709,10 +1435,7 @@ def setup_room_P2(self):
         for x in range(0, SCREEN_WIDTH, SPRITE_SIZE):
             if (x != SPRITE_SIZE * 6 and x!= SPRITE_SIZE * 7)or y!=0:
                 # Skip making a block 6 and 7 blocks down
-                wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall3.jpg"), SPRITE_SCALING/4)
-                wall.left = x
-                wall.bottom = y
-                room.wall_list.append(wall)
+                room.tile_map.place(x, y, "space_station_wall3.jpg", SPRITE_SCALING/4)
 
     # Create left and right column of boxes
     for x in (0, SCREEN_WIDTH - SPRITE_SIZE):
@@ -720,30 +1443,24 @@ def setup_room_P2(self):
         for y in range(SPRITE_SIZE, SCREEN_HEIGHT - SPRITE_SIZE, SPRITE_SIZE):
                 if (y != SPRITE_SIZE * 6 and y!= SPRITE_SIZE * 7)or x==0:
                     # Skip making a block 6 and 7 blocks on the right side
-                    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall6.png"), SPRITE_SCALING/4)
-                    wall.left = x
-                    wall.bottom = y
-                    room.wall_list.append(wall)
+                    room.tile_map.place(x, y, "space_station_wall6.png", SPRITE_SCALING/4)
 
-    room.background = arcade.load_texture(os.path.join(os.path.dirname(__file__), "space_station_floor_trap.jpg"))
+    room.background = textures.get("space_station_floor_trap.jpg")
     
     for i in range(4): 
-        enemy = MOB(self.bar_list)
-        enemy.center_x = random.randrange(SCREEN_WIDTH)
-        enemy.center_y = random.randrange(SCREEN_HEIGHT)
+        enemy = MOB(room.health_bars)
+        enemy.center_x = rng.randrange(SCREEN_WIDTH)
+        enemy.center_y = rng.randrange(SCREEN_HEIGHT)
         room.mob_list.append(enemy)
     return room
 
-def setup_room_6(self):
+def setup_room_6(self, rng=random):
     """
     Create and return room 6.
     """
     room = Room()
 
     """ Set up the game and initialize the variables. """
-    # Sprite lists
-    room.wall_list = arcade.SpriteList()
-
     # -- Set up the walls
     # Create bottom and top row of boxes
     # This y loops a list of two, the coordinate 0, and just under the top of window
@@ -752,10 +1469,7 @@ def setup_room_6(self):
         for x in range(0, SCREEN_WIDTH, SPRITE_SIZE):
             if (x != SPRITE_SIZE * 2 and x!= SPRITE_SIZE * 3)or y!=0:
                 # Skip making a block 2 and 3 blocks down
-                wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall3.jpg"), SPRITE_SCALING/4)
-                wall.left = x
-                wall.bottom = y
-                room.wall_list.append(wall)
+                room.tile_map.place(x, y, "space_station_wall3.jpg", SPRITE_SCALING/4)
 
     # Create left and right column of boxes
     for x in (0, SCREEN_WIDTH - SPRITE_SIZE):
@@ -763,34 +1477,25 @@ def setup_room_6(self):
         for y in range(SPRITE_SIZE, SCREEN_HEIGHT - SPRITE_SIZE, SPRITE_SIZE):
                 if (y != SPRITE_SIZE * 4 and y!= SPRITE_SIZE * 5)or x!=0:
                     # Skip making a block 4 and 5 blocks on the left side
-                    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall6.png"), SPRITE_SCALING/4)
-                    wall.left = x
-                    wall.bottom = y
-                    room.wall_list.append(wall)
-
-    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall.jpg"), SPRITE_SCALING/3)
-    wall.left = 7 * SPRITE_SIZE
-    wall.bottom = 5 * SPRITE_SIZE
-    room.wall_list.append(wall)
-    room.background = arcade.load_texture(os.path.join(os.path.dirname(__file__), "space_station_floor.jpg"))
+                    room.tile_map.place(x, y, "space_station_wall6.png", SPRITE_SCALING/4)
+
+    room.tile_map.place(7 * SPRITE_SIZE, 5 * SPRITE_SIZE, "space_station_wall.jpg", SPRITE_SCALING/3)
+    room.background = textures.get("space_station_floor.jpg")
     
     for i in range(2): 
-        enemy = MOB(self.bar_list)
-        enemy.center_x = random.randrange(SCREEN_WIDTH)
-        enemy.center_y = random.randrange(SCREEN_HEIGHT)
+        enemy = MOB(room.health_bars)
+        enemy.center_x = rng.randrange(SCREEN_WIDTH)
+        enemy.center_y = rng.randrange(SCREEN_HEIGHT)
         room.mob_list.append(enemy)
     return room
 
-def setup_room_7(self):
+def setup_room_7(self, rng=random):
     """
     Create and return room 7.
     """
     room = Room()
 
     """ Set up the game and initialize the variables. """
-    # Sprite lists
-    room.wall_list = arcade.SpriteList()
-
     # -- Set up the walls
     # Create bottom and top row of boxes
     # This y loops a list of two, the coordinate 0, and just under the top of window
@@ -799,10 +1504,7 @@ def setup_room_7(self):
         for x in range(0, SCREEN_WIDTH, SPRITE_SIZE):
             if (x != SPRITE_SIZE * 6 and x!= SPRITE_SIZE * 7) or y==0:
                 # Skip making a block 6 and 7 blocks up
-                wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall3.jpg"), SPRITE_SCALING/4)
-                wall.left = x
-                wall.bottom = y
-                room.wall_list.append(wall)
+                room.tile_map.place(x, y, "space_station_wall3.jpg", SPRITE_SCALING/4)
 
     # Create left and right column of boxes
     for x in (0, SCREEN_WIDTH - SPRITE_SIZE):
@@ -810,50 +1512,34 @@ def setup_room_7(self):
         for y in range(SPRITE_SIZE, SCREEN_HEIGHT - SPRITE_SIZE, SPRITE_SIZE):
                 if (y != SPRITE_SIZE * 4 and y!= SPRITE_SIZE * 5):
                     # Skip making a block 4 and 5 blocks on the left and right side
-                    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall6.png"), SPRITE_SCALING/4)
-                    wall.left = x
-                    wall.bottom = y
-                    room.wall_list.append(wall)
-
-    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall2.jpg"), SPRITE_SCALING/3)
-    wall.left = 5 * SPRITE_SIZE
-    wall.bottom = 5 * SPRITE_SIZE
-    room.wall_list.append(wall)
-
-    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "space_station_wall2.jpg"), SPRITE_SCALING/3)
-    wall.left = 7 * SPRITE_SIZE
-    wall.bottom = 5 * SPRITE_SIZE
-    room.wall_list.append(wall)
-
-    room.background = arcade.load_texture(os.path.join(os.path.dirname(__file__), "space_station_floor.jpg"))
+                    room.tile_map.place(x, y, "space_station_wall6.png", SPRITE_SCALING/4)
+
+    room.tile_map.place(5 * SPRITE_SIZE, 5 * SPRITE_SIZE, "space_station_wall2.jpg", SPRITE_SCALING/3)
+    room.tile_map.place(7 * SPRITE_SIZE, 5 * SPRITE_SIZE, "space_station_wall2.jpg", SPRITE_SCALING/3)
+
+    room.background = textures.get("space_station_floor.jpg")
     
     for i in range(2): 
-        enemy = MOB(self.bar_list)
-        enemy.center_x = random.randrange(SCREEN_WIDTH)
-        enemy.center_y = random.randrange(SCREEN_HEIGHT)
+        enemy = MOB(room.health_bars)
+        enemy.center_x = rng.randrange(SCREEN_WIDTH)
+        enemy.center_y = rng.randrange(SCREEN_HEIGHT)
         room.mob_list.append(enemy)
     return room
 
-def setup_room_Boss(self):
+def setup_room_Boss(self, rng=random):
     """
     Create and return room Boss.
     """
     room = Room()
 
     """ Set up the game and initialize the variables. """
-    # Sprite lists
-    room.wall_list = arcade.SpriteList()
-
     # -- Set up the walls
     # Create bottom and top row of boxes
     # This y loops a list of two, the coordinate 0, and just under the top of window
     for y in (0, SCREEN_HEIGHT - SPRITE_SIZE):
         # Loop for each box going across
         for x in range(0, SCREEN_WIDTH, SPRITE_SIZE):
-            wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "Boss_wall.png"), SPRITE_SCALING/6)
-            wall.left = x
-            wall.bottom = y
-            room.wall_list.append(wall)
+            room.tile_map.place(x, y, "Boss_wall.png", SPRITE_SCALING/6)
 
     # Create left and right column of boxes
     for x in (0, SCREEN_WIDTH - SPRITE_SIZE):
@@ -861,143 +1547,647 @@ def setup_room_Boss(self):
         for y in range(SPRITE_SIZE, SCREEN_HEIGHT - SPRITE_SIZE, SPRITE_SIZE):
                 if (y != SPRITE_SIZE * 4 and y!= SPRITE_SIZE * 5)or x==0:
                     # Skip making a block 4 and 5 blocks on the right side
-                    wall = arcade.Sprite(os.path.join(os.path.dirname(__file__), "Boss_wall.png"), SPRITE_SCALING/6)
-                    wall.left = x
-                    wall.bottom = y
-                    room.wall_list.append(wall)
+                    room.tile_map.place(x, y, "Boss_wall.png", SPRITE_SCALING/6)
 
-    room.background = arcade.load_texture(os.path.join(os.path.dirname(__file__), "Boss_floor.png"))
+    room.background = textures.get("Boss_floor.png")
     
     for i in range(6): 
-        enemy = MOB(self.bar_list)
-        enemy.center_x = random.randrange(SCREEN_WIDTH)
-        enemy.center_y = random.randrange(SCREEN_HEIGHT)
+        enemy = MOB(room.health_bars)
+        enemy.center_x = rng.randrange(SCREEN_WIDTH)
+        enemy.center_y = rng.randrange(SCREEN_HEIGHT)
         room.mob_list.append(enemy)
     return room
 
-class MyGame(arcade.Window):
-    """ Main application class. """
+# Room factories, by the name rooms have in the room graph file
+ROOM_BUILDERS = {
+    "1": setup_room_1,
+    "2": setup_room_2,
+    "P1": setup_room_P1,
+    "3": setup_room_3,
+    "B1": setup_room_B1,
+    "4": setup_room_4,
+    "B2": setup_room_B2,
+    "5": setup_room_5,
+    "P2": setup_room_P2,
+    "6": setup_room_6,
+    "7": setup_room_7,
+    "Boss": setup_room_Boss,
+}
+
+class RoomGraph:
+    """
+    The rooms of the map and how they connect. Rooms are numbered in the
+    order of the file and each exit maps (room number, side) to
+    (target room number, spawn x, spawn y). A spawn coordinate is None
+    when the player keeps that coordinate.
+    :param List[str] names: The name of each room.
+    :param dict exits: The exits, as described above.
+    :param int start: The room the player starts in.
+    """
+
+    SIDES = ("top", "bottom", "left", "right")
+
+    def __init__(self, names: List[str], exits: Dict[Tuple[int, str], tuple], start: int = 0) -> None:
+        self.names: List[str] = names
+        self.exits: Dict[Tuple[int, str], tuple] = exits
+        self.start: int = start
+
+    def __repr__(self) -> str:
+        return f"<RoomGraph (rooms={len(self.names)}, exits={len(self.exits)})>"
 
-    def __init__(self, width, height, title):
+    @classmethod
+    def load(cls, path: str = ROOM_GRAPH_FILE) -> "RoomGraph":
         """
-        Initializer
+        Reads a room graph file. Spawn positions in the file are fractions of
+        the screen size, 0 being the left or bottom edge and 1 the right or top.
         """
-        super().__init__(width, height, title)
+        with open(path) as file:
+            data = json.load(file)
+
+        names = list(data["rooms"])
+        numbers = {name: number for number, name in enumerate(names)}
+        for name in names:
+            if name not in ROOM_BUILDERS:
+                raise ValueError(f"Room {name!r} in {path} has no setup function.")
+
+        exits = {}
+        for name, room in data["rooms"].items():
+            for side, room_exit in room.get("exits", {}).items():
+                if side not in cls.SIDES:
+                    raise ValueError(f"Room {name!r} in {path} has an exit on an unknown side {side!r}.")
+                if room_exit["to"] not in numbers:
+                    raise ValueError(f"Room {name!r} in {path} leads to an unknown room {room_exit['to']!r}.")
+                spawn_x = room_exit.get("x")
+                spawn_y = room_exit.get("y")
+                exits[numbers[name], side] = (
+                    numbers[room_exit["to"]],
+                    None if spawn_x is None else spawn_x * SCREEN_WIDTH,
+                    None if spawn_y is None else spawn_y * SCREEN_HEIGHT,
+                )
+        return cls(names, exits, numbers[data.get("start", names[0])])
 
-        # Set the working directory (where we expect to find files) to the same
-        # directory this .py file is in. You can leave this out of your own
-        # code, but it is needed to easily run the examples using "python -m"
-        # as mentioned at the top of this program.
-        file_path = os.path.dirname(os.path.abspath(__file__))
-        os.chdir(file_path)
+    @property
+    def factories(self) -> list:
+        """Returns the function creating each room, by room number."""
+        return [ROOM_BUILDERS[name] for name in self.names]
 
-        #player part
-        self.epee_list = arcade.SpriteList()
-        self.bullet_list = arcade.SpriteList()
-        
-        self.player_list =  arcade.SpriteList()
-        
-        self.bar_list = arcade.SpriteList()
-        self.player_sprite = Player(self.bar_list)
-        self.enemy_timer = 0
+    @property
+    def neighbours(self) -> Dict[int, List[int]]:
+        """Returns the rooms reachable from each room."""
+        neighbours = {number: [] for number in range(len(self.names))}
+        for (number, _), (target, _, _) in self.exits.items():
+            if target not in neighbours[number]:
+                neighbours[number].append(target)
+        return neighbours
+
+class RandomStreams:
+    """
+    Named random generators all made from one seed. Each name gives its own
+    sequence, so drawing more numbers from one stream (the enemies' "ai")
+    doesn't change another one (the "spawn" of the mobs). The same seed gives
+    the same rooms and the same game.
+    :param int seed: The seed of every stream, a random one if None.
+    """
 
-        # Track the current state of what key is pressed
-        self.left_pressed = False
-        self.right_pressed = False
-        self.up_pressed = False
-        self.down_pressed = False
+    def __init__(self, seed: Optional[int] = None) -> None:
+        self.seed: int = random.randrange(2 ** 32) if seed is None else seed
+        self._streams: Dict[str, random.Random] = {}
 
-        #show the mouse cursor
-        self.set_mouse_visible(True)
-        # Load sounds. Sounds from kenney.nl
-        self.gun_sound = arcade.load_sound(":resources:sounds/hurt5.wav")
-        self.hit_sound = arcade.load_sound(":resources:sounds/hit5.wav")
+    def __repr__(self) -> str:
+        return f"<RandomStreams (seed={self.seed}, streams={list(self._streams)})>"
 
+    def __getitem__(self, name: str) -> random.Random:
+        """Returns the generator of a stream, the same one on every call."""
+        stream = self._streams.get(name)
+        if stream is None:
+            stream = self._streams[name] = self.new(name)
+        return stream
 
+    def new(self, name: str) -> random.Random:
+        """Returns a new generator at the start of a stream."""
+        return random.Random(f"{self.seed}/{name}")
 
-        # Sprite lists
-        self.current_room = 0
+class RoomCache:
+    """
+    Builds the rooms the first time they are used and keeps only the most
+    recently used ones. An evicted room is rebuilt from the start of the
+    same random stream, so it comes back with the same layout, and with the
+    health its mobs had when it was evicted.
+    :param GameState game: The game the rooms belong to.
+    :param list factories: The functions creating each room.
+    :param int capacity: The maximum number of built rooms.
+    :param RandomStreams streams: Where the room layouts are drawn from.
+    """
 
-        # Set up the player
-        self.rooms = None
-        self.physics_engine = None
+    def __init__(
+        self, game, factories, capacity: int = ROOM_CACHE_SIZE, streams: Optional[RandomStreams] = None
+    ) -> None:
+        self.game = game
+        self.factories = factories
+        self.capacity: int = capacity
+        self.streams: RandomStreams = streams or RandomStreams()
+        self._rooms: OrderedDict = OrderedDict()
+        # Asked for a room before building it, in case the worker already did
+        self.prefetcher: Optional["RoomPrefetcher"] = None
+        # Health of the mobs of the evicted rooms, by room number
+        self._mob_health = {}
+        self.builds: int = 0
+        self.evictions: int = 0
 
-    def setup(self):
-        """ Set up the game and initialize the variables. """
-                # Setup player and enemy positions
-        self.player_sprite.position = self.width // 2, self.height // 4
-        self.player_list.append(self.player_sprite)
+    def __repr__(self) -> str:
+        return f"<RoomCache (built={list(self._rooms)}, builds={self.builds}, evictions={self.evictions})>"
+
+    def __len__(self) -> int:
+        return len(self.factories)
+
+    def __getitem__(self, index: int) -> Room:
+        """Returns a room, building it if needed."""
+        room = self._rooms.get(index)
+        if room is None:
+            if self.prefetcher is not None:
+                room = self.prefetcher.take(index)
+            if room is None:
+                room = self.create(index)
+            self.add(index, room)
+        else:
+            self._rooms.move_to_end(index)
+        return room
 
-        # Our list of rooms
-        self.rooms = []
+    def __contains__(self, index: int) -> bool:
+        """Returns True if the room is built."""
+        return index in self._rooms
 
-        # Create the rooms. Extend the pattern for each room.
-        room = setup_room_1()
-        self.rooms.append(room)
+    def create(self, index: int) -> Room:
+        """
+        Builds a room without adding it to the cache. Doesn't need the GL
+        context, so it can run on another thread.
+        """
+        rng = self.streams.new(f"spawn/{index}")
+        room = self.factories[index](self.game, rng)
+        room.mobs = list(room.mob_list)
+        for mob in room.mobs:
+            mob.indicator_bar.follow()
+        room.build_walls()
+        room.index_walls()
+        room.index_mobs()
+        self.builds += 1
+        return room
+
+    def add(self, index: int, room: Room) -> None:
+        """
+        Adds a room built by create, evicting the least recently used rooms.
+        The GL buffers of the room are made when it is first drawn.
+        """
+        # Put the mobs back the way they were when the room was evicted
+        for mob, health in zip(room.mobs, self._mob_health.pop(index, [])):
+            mob.health = health
+            if health <= 0:
+                room.remove_mob(mob)
+                mob.indicator_bar.release()
+
+        self._rooms[index] = room
+        for old in list(self._rooms):
+            if len(self._rooms) <= self.capacity:
+                break
+            # Never evict the room the player is in
+            if old != self.game.current_room:
+                self._evict(old)
+
+    def _evict(self, index: int) -> None:
+        room = self._rooms.pop(index)
+        self._mob_health[index] = [mob.health for mob in room.mobs]
+        room.release()
+        self.evictions += 1
+
+class RoomPrefetcher:
+    """
+    Builds the rooms next to the current one on a worker thread so entering
+    them doesn't stall a frame. The worker only makes sprites and lazy
+    sprite lists, the GL work is finished on the main thread by update. It
+    is split in the steps of Room.gl_steps, and a step only starts if the
+    time it took last time fits in what is left of the frame's budget, so
+    a room can take several frames.
+    :param RoomCache rooms: The cache the rooms are added to.
+    :param dict neighbours: The rooms reachable from each room.
+    :param float budget: Seconds per frame update may spend on finishing rooms.
+    """
 
-        room = setup_room_2(self)
-        self.rooms.append(room)
+    def __init__(self, rooms: RoomCache, neighbours, budget: float = PREFETCH_BUDGET) -> None:
+        self.rooms: RoomCache = rooms
+        self.neighbours = neighbours
+        self.budget: float = budget
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # Room number -> future of the room
+        self._pending = {}
+        # Room number -> room built by the worker and its GL steps left to run,
+        # with their position in Room.gl_steps
+        self._finishing: Dict[int, Tuple[Room, deque]] = {}
+        # Seconds the step at each position of Room.gl_steps took last time
+        self.step_costs: Dict[int, float] = {}
+        self.prefetched: int = 0
+        # Rooms entered before they were ready, finished on the spot
+        self.taken: int = 0
+        # Frames on which the budget left GL steps for the next frame
+        self.deferred: int = 0
 
-        room = setup_room_P1(self)
-        self.rooms.append(room)
+    def __repr__(self) -> str:
+        return (
+            f"<RoomPrefetcher (pending={list(self._pending)}, finishing={list(self._finishing)}, "
+            f"prefetched={self.prefetched}, taken={self.taken})>"
+        )
 
-        room = setup_room_3(self)
-        self.rooms.append(room)
+    def request(self, current: int) -> None:
+        """Starts building the rooms next to the current one which aren't built yet."""
+        for index in self.neighbours.get(current, []):
+            if index not in self.rooms and index not in self._pending and index not in self._finishing:
+                self._pending[index] = self.executor.submit(self.rooms.create, index)
+
+    def update(self, current: int) -> None:
+        """Runs the GL steps of the rooms built by the worker until the frame budget is spent."""
+        start = time.perf_counter()
+        ran = False
+        for index, future in list(self._pending.items()):
+            if future.done():
+                del self._pending[index]
+                room = future.result()
+                self._finishing[index] = (room, deque(enumerate(room.gl_steps())))
+
+        for index, (room, steps) in list(self._finishing.items()):
+            # The player may have walked away, or the room was built another way
+            if index in self.rooms or index not in self.neighbours.get(current, []):
+                del self._finishing[index]
+                room.release()
+                continue
+            while steps:
+                position, step = steps[0]
+                # The first step of a frame always runs so the rooms get finished
+                elapsed = time.perf_counter() - start
+                if ran and elapsed + self.step_costs.get(position, 0.0) > self.budget:
+                    self.deferred += 1
+                    return
+                steps.popleft()
+                step_start = time.perf_counter()
+                step()
+                self.step_costs[position] = time.perf_counter() - step_start
+                ran = True
+            del self._finishing[index]
+            self.rooms.add(index, room)
+            self.prefetched += 1
+
+    def take(self, index: int) -> Optional[Room]:
+        """
+        Returns a room the worker is building, or has built but isn't
+        finished, waiting for the worker and running the GL steps left.
+        Returns None if the room isn't being prefetched. Used when the player
+        enters a room before it was ready, so it isn't built a second time.
+        """
+        future = self._pending.pop(index, None)
+        if future is not None:
+            room = future.result()
+            steps = deque(enumerate(room.gl_steps()))
+        elif index in self._finishing:
+            room, steps = self._finishing.pop(index)
+        else:
+            return None
+        for position, step in steps:
+            step()
+        self.taken += 1
+        return room
+
+    def shutdown(self) -> None:
+        """Stops the worker thread."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
-        room = setup_room_B1()
-        self.rooms.append(room)
-        
-        room = setup_room_4(self)
-        self.rooms.append(room)
+class AttackScheduler:
+    """
+    Decides which enemies fire on each frame. Every enemy has its own due
+    time in a heap. The first attacks are spread over one cooldown, and each
+    next one comes a cooldown later, give or take the jitter, so the enemies
+    don't all fire on the same frame.
+    :param float cooldown: Average time between two attacks of an enemy.
+    :param float jitter: Most time an attack comes before or after the cooldown.
+    :param int budget: Most enemies firing on the same frame.
+    :param random.Random rng: Where the random delays come from.
+    """
 
-        room = setup_room_B2()
-        self.rooms.append(room)
+    def __init__(
+        self,
+        cooldown: float = ENEMY_ATTACK_COOLDOWN,
+        jitter: float = ENEMY_ATTACK_JITTER,
+        budget: int = ENEMY_ATTACK_BUDGET,
+        rng=random,
+    ) -> None:
+        self.cooldown: float = cooldown
+        self.jitter: float = jitter
+        self.budget: int = budget
+        self.rng = rng
+        self.time: float = 0.0
+        # (due time, order added, enemy), the order keeps enemies from being compared
+        self._heap: List[Tuple[float, int, MOB]] = []
+        self._added: int = 0
+        # Frames on which the budget pushed attacks to the next frame
+        self.deferred: int = 0
 
-        room = setup_room_5(self)
-        self.rooms.append(room)
+    def __repr__(self) -> str:
+        return f"<AttackScheduler (queued={len(self._heap)}, deferred={self.deferred})>"
 
-        room = setup_room_P2(self)
-        self.rooms.append(room)
+    def __len__(self) -> int:
+        return len(self._heap)
 
-        room = setup_room_6(self)
-        self.rooms.append(room)
+    def _push(self, mob: MOB, delay: float) -> None:
+        heapq.heappush(self._heap, (self.time + delay, self._added, mob))
+        self._added += 1
 
-        room = setup_room_7(self)
-        self.rooms.append(room)
+    def reset(self, mobs) -> None:
+        """Forgets every enemy and schedules the first attack of the given ones."""
+        self._heap.clear()
+        for mob in mobs:
+            self._push(mob, self.rng.uniform(0, self.cooldown))
 
-        room = setup_room_Boss(self)
-        self.rooms.append(room)
+    def update(self, delta_time: float) -> List[MOB]:
+        """
+        Moves the clock forward and returns the living enemies which fire
+        this frame. Dead enemies are dropped when their turn comes.
+        """
+        self.time += delta_time
+        heap = self._heap
+        ready = []
+        while heap and heap[0][0] <= self.time:
+            if len(ready) >= self.budget:
+                self.deferred += 1
+                break
+            mob = heapq.heappop(heap)[2]
+            if mob.health <= 0:
+                continue
+            ready.append(mob)
+            self._push(mob, self.cooldown + self.rng.uniform(-self.jitter, self.jitter))
+        return ready
+
+class StageProfiler:
+    """
+    Times the stages of each frame. start() begins a frame, each lap(stage)
+    adds the time since the previous lap to a stage, and end_frame() stores
+    the frame. The draw stages only time the CPU side of the draw calls.
+    :param int window: Number of frames the percentiles are computed over.
+    :param str csv_path: File every frame's timings are written to, if any.
+    """
 
-        # Our starting room number
-        self.current_room = 0
+    def __init__(self, window: int = PROFILE_WINDOW, csv_path: Optional[str] = None) -> None:
+        # Milliseconds spent in each stage over the last frames
+        self.samples: Dict[str, deque] = {stage: deque(maxlen=window) for stage in PROFILE_STAGES}
+        self._frame: Dict[str, float] = dict.fromkeys(PROFILE_STAGES, 0.0)
+        self._last: Optional[float] = None
+        self.frames: int = 0
+        self._csv_file = None
+        self._csv = None
+        if csv_path is not None:
+            self._csv_file = open(csv_path, "w", newline="")
+            self._csv = csv.writer(self._csv_file)
+            self._csv.writerow(("frame",) + PROFILE_STAGES)
 
-        # Create a physics engine for this room
-        self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
+    def __repr__(self) -> str:
+        return f"<StageProfiler (frames={self.frames})>"
+
+    def start(self) -> None:
+        """Starts timing a frame."""
+        self._last = time.perf_counter()
+
+    def lap(self, stage: str) -> None:
+        """Adds the time since the previous lap to a stage."""
+        now = time.perf_counter()
+        if self._last is not None:
+            self._frame[stage] += now - self._last
+        self._last = now
+
+    def end_frame(self) -> None:
+        """Stores the timings of the frame and writes them to the CSV file."""
+        frame = self._frame
+        for stage in PROFILE_STAGES:
+            self.samples[stage].append(frame[stage] * 1000)
+        if self._csv is not None:
+            self._csv.writerow([self.frames] + [f"{frame[stage] * 1000:.3f}" for stage in PROFILE_STAGES])
+        self._frame = dict.fromkeys(PROFILE_STAGES, 0.0)
+        self._last = None
+        self.frames += 1
+
+    def percentiles(self, stage: str) -> Tuple[float, float, float]:
+        """Returns the p50, p95 and p99 of a stage over the last frames, in milliseconds."""
+        samples = sorted(self.samples[stage])
+        if not samples:
+            return 0.0, 0.0, 0.0
+        last = len(samples) - 1
+        return tuple(samples[round(last * rank)] for rank in (0.5, 0.95, 0.99))
+
+    def __str__(self) -> str:
+        lines = [f"{'stage':<18}{'p50':>7}{'p95':>7}{'p99':>7} ms"]
+        for stage in PROFILE_STAGES:
+            p50, p95, p99 = self.percentiles(stage)
+            lines.append(f"{stage:<18}{p50:7.2f}{p95:7.2f}{p99:7.2f}")
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        """Closes the CSV file."""
+        if self._csv_file is not None:
+            self._csv_file.close()
+            self._csv_file = None
+            self._csv = None
+
+class FrameTimeHistogram:
+    """
+    Counts the frames by how long the game took to update and draw them.
+    :param Tuple[float, ...] bounds: The upper bounds of the buckets in milliseconds.
+    """
 
-    def on_draw(self):
+    def __init__(self, bounds: Tuple[float, ...] = (2, 4, 8, 16, 33, 66)) -> None:
+        self.bounds: Tuple[float, ...] = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.worst: float = 0.0
+
+    def add(self, seconds: float) -> None:
+        """Counts one frame."""
+        milliseconds = seconds * 1000
+        self.worst = max(self.worst, milliseconds)
+        self.counts[bisect.bisect_left(self.bounds, milliseconds)] += 1
+
+    def __str__(self) -> str:
+        lines = []
+        low = 0
+        for bound, count in zip(self.bounds, self.counts):
+            lines.append(f"{low:>4}-{bound:<4} ms: {count}")
+            low = bound
+        lines.append(f"{low:>4}+     ms: {self.counts[-1]}")
+        lines.append(f"worst: {self.worst:.1f} ms")
+        return "\n".join(lines)
+
+class InputRecorder:
+    """
+    Writes the input events of a game to a compact binary file. The file
+    starts with the seed of the game, then each event is the tick it came
+    before, a number of seconds, its kind and its key or mouse button. Every
+    tick is written too, as an INPUT_TICK event holding the seconds the tick
+    was stepped with, so the frame rate of the session is replayed with it.
+    The seconds are a double, the float the game steps with, so the replay
+    doesn't drift from the session.
+    :param str path: The file to write.
+    :param int seed: The seed of the recorded game.
+    """
+
+    MAGIC = b"GSIN"
+    VERSION = 3
+    HEADER = struct.Struct("<4sHq")
+    EVENT = struct.Struct("<IdBi")
+
+    def __init__(self, path: str, seed: int) -> None:
+        self.path: str = path
+        self.file = open(path, "wb")
+        self.file.write(self.HEADER.pack(self.MAGIC, self.VERSION, seed))
+        self.events: int = 0
+
+    def __repr__(self) -> str:
+        return f"<InputRecorder (path={self.path!r}, events={self.events})>"
+
+    def record(self, tick: int, kind: int, code: int = 0, seconds: float = 0.0) -> None:
+        """Writes one event."""
+        self.file.write(self.EVENT.pack(tick, seconds, kind, code))
+        self.events += 1
+
+    def record_tick(self, tick: int, delta_time: float) -> None:
+        """Writes the seconds the game is about to step its tick with."""
+        self.record(tick, INPUT_TICK, seconds=delta_time)
+
+    def close(self, tick: int) -> None:
+        """Writes the tick the game stopped at and closes the file."""
+        if self.file is not None:
+            self.record(tick, INPUT_END)
+            self.file.close()
+            self.file = None
+
+class InputReplay:
+    """
+    Plays back a file written by InputRecorder. Each event is given to the
+    game just before the tick it was recorded at, and each tick is stepped
+    with the seconds it was recorded with, so a replay runs the same way as
+    the session, whatever its frame rate was.
+    :param str path: The file to read.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        with open(path, "rb") as file:
+            data = file.read()
+        magic, version, self.seed = InputRecorder.HEADER.unpack_from(data)
+        if magic != InputRecorder.MAGIC or version != InputRecorder.VERSION:
+            raise ValueError(f"{path} is not an input recording this game can read")
+        # (tick, seconds, kind, code) of every event, in the order they were recorded
+        self.events = list(InputRecorder.EVENT.iter_unpack(data[InputRecorder.HEADER.size:]))
+        self._next: int = 0
+        self.end_tick: int = self.events[-1][0] if self.events and self.events[-1][2] == INPUT_END else None
+
+    def __repr__(self) -> str:
+        return f"<InputReplay (path={self.path!r}, events={len(self.events)}, played={self._next})>"
+
+    @property
+    def done(self) -> bool:
+        """Returns True once every event was played."""
+        return self._next >= len(self.events)
+
+    def apply(self, state: "GameState") -> float:
         """
-        Render the screen.
+        Gives the game the events recorded before its current tick. Returns
+        the seconds to step the tick with.
         """
-        # This command has to happen before we start drawing
-        self.clear()
+        events = self.events
+        while self._next < len(events) and events[self._next][0] <= state.ticks:
+            tick, seconds, kind, code = events[self._next]
+            self._next += 1
+            if kind == INPUT_TICK:
+                return seconds
+            if kind != INPUT_END:
+                state.handle_input(kind, code)
+        return REPLAY_TIMESTEP
+
+    def run(self, state: "GameState") -> int:
+        """Replays the whole recording on a headless game. Returns the number of ticks run."""
+        start = state.ticks
+        while not self.done and not state.game_over:
+            delta_time = self.apply(state)
+            if self.done and self.end_tick is not None:
+                break
+            state.profiler.start()
+            state.update(delta_time)
+            state.profiler.end_frame()
+            state.sounds.clear()
+        return state.ticks - start
+
+class GameState:
+    """
+    Everything the game simulates: the player, the rooms and their mobs, the
+    enemy bullets, the epee and the room transitions. It doesn't need a
+    window or a GL context, so it can be stepped headless at any tick rate.
+    MyGame draws it and feeds it the player's input.
+    :param atlas: The texture atlas of the sprite lists, None when headless.
+    :param int seed: The seed of every random stream, a random one if None.
+    """
 
-        # Draw the background texture
-        arcade.draw_lrwh_rectangle_textured(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT, self.rooms[self.current_room].background)
+    def __init__(self, atlas: Optional[arcade.TextureAtlas] = None, seed: Optional[int] = None) -> None:
+        # Every random number of the game comes from these streams
+        self.random = RandomStreams(seed)
 
-        # Draw all the walls in this room
-        self.rooms[self.current_room].wall_list.draw()
-        self.rooms[self.current_room].mob_list.draw()
+        #player part
+        self.epee_list = arcade.SpriteList(atlas=atlas, lazy=True)
+        self.bullet_list = arcade.SpriteList(atlas=atlas, lazy=True)
+        self.bullet_pool = BulletPool(self.bullet_list)
 
-        # Draw all the sprites
-        self.player_sprite.draw()
-        self.epee_list.draw()
+        self.player_list = arcade.SpriteList(atlas=atlas, lazy=True)
 
-        self.bullet_list.draw()
+        # The player's indicator bar, the mobs' ones belong to their room
+        self.health_bars = HealthBars()
+        self.player_sprite = Player(self.health_bars)
+        # Which enemies fire on each frame
+        self.attacks = AttackScheduler(rng=self.random["ai"])
 
-        self.bar_list.draw()
-        self.player_list.draw()
+        # Track the current state of what key is pressed
+        self.left_pressed = False
+        self.right_pressed = False
+        self.up_pressed = False
+        self.down_pressed = False
+        # Direction of the last move key, where the epee strikes
+        self.facing: Optional[str] = None
+
+        # Names of the sounds to play, emptied by whoever plays them
+        self.sounds: List[str] = []
+        self.game_over = False
+        self.ticks = 0
+        # Times the stages of update, and of the drawing when there is a window
+        self.profiler = StageProfiler()
 
-    def update_player_speed(self):
+        self.current_room = 0
+        self.room_graph = None
+        self.rooms = None
+        self.physics_engine = None
+
+    def __repr__(self) -> str:
+        return f"<GameState (room={self.current_room}, ticks={self.ticks}, health={self.player_sprite.health})>"
+
+    @property
+    def room(self) -> Room:
+        """Returns the room the player is in."""
+        return self.rooms[self.current_room]
+
+    def setup(self) -> None:
+        """ Set up the game and initialize the variables. """
+        # Setup player and enemy positions
+        self.player_sprite.position = SCREEN_WIDTH // 2, SCREEN_HEIGHT // 4
+        self.player_list.append(self.player_sprite)
+
+        # Our list of rooms, each one is built the first time it is entered
+        self.room_graph = RoomGraph.load()
+        self.rooms = RoomCache(self, self.room_graph.factories, streams=self.random)
+
+        # Start in the first room, with its physics engine
+        self.enter_room(self.room_graph.start)
+
+    def update_player_speed(self) -> None:
         # Calculate speed based on the keys pressed
 
         self.player_sprite.change_x = 0
@@ -1015,321 +2205,387 @@ class MyGame(arcade.Window):
         elif self.right_pressed and not self.left_pressed:
             self.player_sprite.change_x = MOVEMENT_SPEED
 
-    def on_mouse_press(self, x, y, button, modifiers):
-        """
-        Called whenever the mouse button is clicked.
-        """
-        # Gunshot sound
-        arcade.play_sound(self.gun_sound)
+    def press(self, key: int) -> None:
+        """Handles a key being pressed."""
+        if key == arcade.key.Z :
+            self.up_pressed = True
+            self.facing = "up"
+
+        elif key == arcade.key.S :
+            self.down_pressed = True
+            self.facing = "down"
+
+        elif key == arcade.key.Q :
+            self.left_pressed = True
+            self.facing = "left"
+
+        elif key == arcade.key.D :
+            self.right_pressed = True
+            self.facing = "right"
+
+        self.update_player_speed()
+
+    def release(self, key: int) -> None:
+        """Handles a key being released."""
+        if key == arcade.key.Z :
+            self.up_pressed = False
+
+        elif key == arcade.key.S :
+            self.down_pressed = False
+
+        elif key == arcade.key.Q :
+            self.left_pressed = False
+
+        elif key == arcade.key.D :
+            self.right_pressed = False
+
+        self.update_player_speed()
+
+    def handle_input(self, kind: int, code: int = 0) -> None:
+        """Handles an input event of one of the INPUT_* kinds."""
+        if kind == INPUT_KEY_PRESS:
+            self.press(code)
+        elif kind == INPUT_KEY_RELEASE:
+            self.release(code)
+        elif kind == INPUT_MOUSE_PRESS:
+            self.attack()
+
+    def attack(self) -> None:
+        """Strikes with the epee towards the direction the player last moved to."""
+        self.sounds.append("gun")
         # Create a bullet
-        epee = arcade.Sprite(":resources:gui_basic_assets/items/sword_gold.png", SPRITE_SCALING_EPEE)
+        epee = textures.sprite(EPEE_IMAGE, SPRITE_SCALING_EPEE)
 
         #Coup en haut
-        if Dir_bullet_gauche == False and Dir_bullet_droite == False and Dir_bullet_bas == True and Dir_bullet_haut == False :
+        if self.facing == "down":
             epee.angle = 180
             epee.change_y = -EPEE_SPEED
             epee.center_x = self.player_sprite.center_x
             epee.top = self.player_sprite.bottom
 
         #Coup en bas
-        elif Dir_bullet_gauche == False and Dir_bullet_droite == False and Dir_bullet_bas == False and Dir_bullet_haut == True :
+        elif self.facing == "up":
             epee.angle = 0
             epee.change_y = EPEE_SPEED
             epee.center_x = self.player_sprite.center_x
             epee.bottom = self.player_sprite.top
 
         #Coup à droite
-        elif Dir_bullet_gauche == False and Dir_bullet_droite == True and Dir_bullet_bas == False and Dir_bullet_haut == False :
+        elif self.facing == "right":
             epee.angle = -90
             epee.change_x = EPEE_SPEED
             epee.center_y = self.player_sprite.center_y
             epee.left = self.player_sprite.right
 
         #Coup à gauche
-        elif Dir_bullet_gauche == True and Dir_bullet_droite == False and Dir_bullet_bas == False and Dir_bullet_haut == False :
+        elif self.facing == "left":
             epee.angle = 90
             epee.change_x = -EPEE_SPEED
             epee.center_y = self.player_sprite.center_y
             epee.right = self.player_sprite.left
-                
+
         # Add the bullet to the appropriate lists
         self.epee_list.append(epee)
 
+    def update_bullets(self, delta_time: float = 1 / 60) -> None:
+        """
+        Moves the enemy bullets, gives back the ones that left the screen and
+        damages the player for each bullet that hit. Runs every frame.
+        """
+        self.bullet_pool.on_update(delta_time)
+
+        for slot in self.bullet_pool.collide(self.player_sprite):
+            # Damage the player and remove the bullet
+            # The player's indicator bar follows its health
+            self.player_sprite.health -= BULLET_DAMAGE
+            self.bullet_pool.release(self.bullet_pool.bullets[slot])
+
+    def enter_room(self, index: int, spawn_x: Optional[float] = None, spawn_y: Optional[float] = None) -> None:
+        """Puts the player in a room, at the given coordinates when they are not None."""
+        self.current_room = index
+        self.physics_engine = self.room.physics_for(self.player_sprite)
+        self.attacks.reset(self.room.mob_list)
+        if spawn_x is not None:
+            self.player_sprite.center_x = spawn_x
+        if spawn_y is not None:
+            self.player_sprite.center_y = spawn_y
+
+    def update(self, delta_time: float = 1 / 60) -> None:
+        """ Movement and game logic """
+        self.ticks += 1
+        profiler = self.profiler
 
-    def on_key_press(self, key, modifiers):
-        """Called whenever a key is pressed. """
-
-        global Dir_bullet_droite, Dir_bullet_gauche, Dir_bullet_haut, Dir_bullet_bas
-
-        if key == arcade.key.Z :
-            self.up_pressed = True
-            self.update_player_speed()
-            Dir_bullet_droite = False
-            Dir_bullet_gauche = False
-            Dir_bullet_haut = True
-            Dir_bullet_bas = False
-
-        elif key == arcade.key.S :
-            self.down_pressed = True
-            self.update_player_speed()
-            Dir_bullet_droite = False
-            Dir_bullet_gauche = False
-            Dir_bullet_haut = False
-            Dir_bullet_bas = True
+        # Call update on all sprites (The sprites don't do much in this
+        # example though.)
+        self.physics_engine.update()
+        profiler.lap("physics")
 
-        elif key == arcade.key.Q :
-            self.left_pressed = True
-            self.update_player_speed()
-            Dir_bullet_droite = False
-            Dir_bullet_gauche = True
-            Dir_bullet_haut = False
-            Dir_bullet_bas = False
+        # Check if the player is dead. If so, the game is over
+        if self.player_sprite.health <= 0:
+            self.game_over = True
+            return
 
-        elif key == arcade.key.D :
-            self.right_pressed = True
-            self.update_player_speed()
-            Dir_bullet_droite = True
-            Dir_bullet_gauche = False
-            Dir_bullet_haut = False
-            Dir_bullet_bas = False
+        for i in list(self.room.mob_list):
+            if i.health <= 0 :
+                self.room.remove_mob(i)
+                i.indicator_bar.release()
+        profiler.lap("mob cleanup")
+
+        # Move the player's indicator bar if the player moved. The mobs'
+        # bars only move when a mob is moved with Room.move_mob.
+        self.player_sprite.indicator_bar.follow()
+        profiler.lap("bar updates")
+
+        # Move the bullets, drop the off-screen ones and check for hits
+        self.update_bullets(delta_time)
+        profiler.lap("bullet collision")
+
+        # Shoot a bullet from each enemy whose attack is ready towards
+        # the player
+        shooters = self.attacks.update(delta_time)
+        if shooters:
+            self.bullet_pool.fire_volley(
+                [i.position for i in shooters],
+                self.player_sprite.position,
+            )
+        profiler.lap("bullet spawn")
 
-    def on_key_release(self, key, modifiers):
-        """Called when the user releases a key. """
-        if key == arcade.key.Z :
-            self.up_pressed = False
-            self.update_player_speed()
+        self.epee_list.update()
+        self.player_list.update()
 
-        elif key == arcade.key.S :
-            self.down_pressed = False
-            self.update_player_speed()
+        # Loop through each bullet
+        for epee in self.epee_list:
+            # Only the mobs in the cells around the epee are checked
+            for i in self.room.mobs_hit_by(epee):
+            # Damage the enemy and remove the epee
+                i.health -= BULLET_DAMAGE
+                epee.remove_from_sprite_lists()
 
-        elif key == arcade.key.Q :
-            self.left_pressed = False
-            self.update_player_speed()
+            # Hit Sound
+                self.sounds.append("hit")
 
-        elif key == arcade.key.D :
-            self.right_pressed = False
-            self.update_player_speed()
+            if len(self.epee_list) > 1 or (abs(epee.center_x - self.player_sprite.center_x) > 50) or (abs(epee.center_y - self.player_sprite.center_y) > 50):
+                epee.remove_from_sprite_lists()
+        profiler.lap("epee collision")
 
-    def on_update(self, delta_time):
-        """ Movement and game logic """
+        # Do some logic here to figure out what room we are in, and if we need to go
+        # to a different room.
+        side = exit_side(self.player_sprite)
+        if side is not None:
+            room_exit = self.room_graph.exits.get((self.current_room, side))
+            if room_exit is not None:
+                self.enter_room(*room_exit)
+        profiler.lap("room transition")
+
+        # Count the bars which didn't need a refresh this frame
+        self.room.health_bars.end_frame()
+        self.health_bars.end_frame()
+        profiler.lap("bar updates")
+
+    def run(self, ticks: int, delta_time: float = 1 / 60) -> int:
+        """
+        Steps the game for a number of ticks, or until the player dies.
+        The sounds aren't played. Returns the number of ticks run.
+        """
+        for tick in range(ticks):
+            if self.game_over:
+                return tick
+            self.profiler.start()
+            self.update(delta_time)
+            self.profiler.end_frame()
+            self.sounds.clear()
+        return ticks
 
-        # Call update on all sprites (The sprites don't do much in this
-        # example though.)
-        self.physics_engine.update()
+class MyGame(arcade.Window):
+    """ Main application class. Draws a GameState and feeds it the input. """
 
-        # Check if the player is dead. If so, exit the game
-        if self.player_sprite.health <= 0:
-            arcade.exit()
-        
-        for i in self.rooms[self.current_room].mob_list:
-            if i.health <= 0 :
-                i.remove_from_sprite_lists()
-                i.indicator_bar.position = -500,-500
+    def __init__(self, width, height, title, seed=None, profile_csv=None, record=None, replay=None):
+        """
+        Initializer
+        """
+        super().__init__(width, height, title)
 
-        # Increase the enemy's timer
-        self.enemy_timer += delta_time
+        # Pack every texture in one atlas before any sprite list is created
+        textures.build_atlas(ATLAS_FILES)
 
-        # Update the player's indicator bar position
-        self.player_sprite.indicator_bar.position = (
-            self.player_sprite.center_x,
-            self.player_sprite.center_y + INDICATOR_BAR_OFFSET,
-        )
+        # Set the working directory (where we expect to find files) to the same
+        # directory this .py file is in. You can leave this out of your own
+        # code, but it is needed to easily run the examples using "python -m"
+        # as mentioned at the top of this program.
+        file_path = os.path.dirname(os.path.abspath(__file__))
+        os.chdir(file_path)
 
-        for i in self.rooms[self.current_room].mob_list:
-            i.indicator_bar.position = (i.center_x, i.center_y + INDICATOR_BAR_OFFSET)
+        # What is simulated, this window only draws it
+        self.state = GameState(textures.atlas, seed)
+        self.profiler = self.state.profiler = StageProfiler(csv_path=profile_csv)
 
-        # Call updates on bullet sprites
-        self.bullet_list.on_update(delta_time)
+        #show the mouse cursor
+        self.set_mouse_visible(True)
+        # Load sounds. Sounds from kenney.nl
+        self.sounds = {
+            "gun": arcade.load_sound(":resources:sounds/hurt5.wav"),
+            "hit": arcade.load_sound(":resources:sounds/hit5.wav"),
+        }
+
+        # How long each frame took, printed when the game is closed
+        self.frame_times = FrameTimeHistogram()
+        self._frame_start = None
+        self.prefetcher = None
+
+        # Draw calls of the last frame, shown with F1
+        self.draw_counter = DrawCounter()
+        self.show_draw_counter = False
+        # Per stage timings, shown with F2
+        self.show_profiler = False
+
+        # The input is written to a file when recording. When replaying,
+        # the input comes from the recording instead of the player.
+        self.replay: Optional[InputReplay] = replay
+        self.recorder: Optional[InputRecorder] = None
+        if record is not None:
+            self.recorder = InputRecorder(record, self.state.random.seed)
 
-        # Check if the enemy can attack. If so, shoot a bullet from the
-        # enemy towards the player
-        if self.enemy_timer >= ENEMY_ATTACK_COOLDOWN:
-            self.enemy_timer = 0
+    def setup(self):
+        """ Set up the game and initialize the variables. """
+        self.state.setup()
+        if PREFETCH_ROOMS:
+            self.prefetcher = RoomPrefetcher(self.state.rooms, self.state.room_graph.neighbours)
+            self.state.rooms.prefetcher = self.prefetcher
 
-            # Create the bullet
-            bullet = Bullet()
-            for i in self.rooms[self.current_room].mob_list:
-                bullet = Bullet()
-            # Set the bullet's position
-                bullet.position = i.position
+    def on_draw(self):
+        """
+        Render the screen.
+        """
+        state = self.state
+        room = state.room
+        profiler = self.profiler
 
-            # Set the bullet's angle to face the player
-                diff_x = self.player_sprite.center_x - i.center_x
-                diff_y = self.player_sprite.center_y - i.center_y
-                angle = math.atan2(diff_y, diff_x)
-                angle_deg = math.degrees(angle)
-                if angle_deg < 0:
-                    angle_deg += 360
-                bullet.angle = angle_deg
+        # This command has to happen before we start drawing
+        self.clear()
+        self.draw_counter.reset()
 
-            # Give the bullet a velocity towards the player
-                bullet.change_x = math.cos(angle) * BULLET_SPEED
-                bullet.change_y = math.sin(angle) * BULLET_SPEED
+        # Draw the background texture and all the walls in this room
+        room.draw_static()
+        self.draw_counter.count(room.static_layer.texture)
+        profiler.lap("draw static")
 
-            # Add the bullet to the bullet list
-                self.bullet_list.append(bullet)
+        self.draw_counter.draw(room.mob_list)
+        profiler.lap("draw mobs")
 
-        # Loop through each bullet 
-            for existing_bullet in self.bullet_list:
-            # Check if the bullet has gone off-screen. If so, delete the bullet
-                if sprite_off_screen(existing_bullet):
-                    existing_bullet.remove_from_sprite_lists()
-                    continue
+        # Draw all the sprites
+        self.draw_counter.draw(state.epee_list)
+        profiler.lap("draw epee")
+
+        self.draw_counter.draw(state.bullet_list)
+        profiler.lap("draw bullets")
+
+        room.health_bars.draw()
+        self.draw_counter.count(None)
+        state.health_bars.draw()
+        self.draw_counter.count(None)
+        profiler.lap("draw bars")
+        self.draw_counter.draw(state.player_list)
+        profiler.lap("draw player")
+
+        if self._frame_start is not None:
+            self.frame_times.add(time.perf_counter() - self._frame_start)
+            self._frame_start = None
+            profiler.end_frame()
+
+        if self.show_draw_counter:
+            bullet_pool = state.bullet_pool
+            arcade.draw_text(
+                f"Draw calls: {self.draw_counter.draw_calls}  Texture binds: {self.draw_counter.texture_binds}  "
+                f"Bullets: {len(bullet_pool)}/{bullet_pool.size} "
+                f"(avg {bullet_pool.average:.1f}, max {bullet_pool.high_water})  "
+                f"Bars skipped: {room.health_bars.skipped + state.health_bars.skipped}",
+                10, 10, arcade.color.WHITE, 14,
+            )
 
-            # Check if the bullet has hit the player
-                if arcade.check_for_collision(existing_bullet, self.player_sprite):
-                # Damage the player and remove the bullet
-                    self.player_sprite.health -= BULLET_DAMAGE
-                    existing_bullet.remove_from_sprite_lists()
+        if self.show_profiler:
+            arcade.draw_text(
+                str(profiler), 10, self.height - 10, arcade.color.WHITE, 12,
+                anchor_y="top", multiline=True, width=480, font_name="Courier New",
+            )
 
-                # Set the player's indicator bar fullness
-                    self.player_sprite.indicator_bar.fullness = (
-                        self.player_sprite.health / PLAYER_HEALTH
-                    )
+    def on_mouse_press(self, x, y, button, modifiers):
+        """
+        Called whenever the mouse button is clicked.
+        """
+        self.send_input(INPUT_MOUSE_PRESS, button)
 
-        self.epee_list.update()
-        self.player_list.update()
+    def on_key_press(self, key, modifiers):
+        """Called whenever a key is pressed. """
+        if key == arcade.key.F1:
+            self.show_draw_counter = not self.show_draw_counter
+        if key == arcade.key.F2:
+            self.show_profiler = not self.show_profiler
 
-        # Loop through each bullet
-        for epee in self.epee_list:
-            for i in self.rooms[self.current_room].mob_list:
-                if arcade.check_for_collision(epee, i):
-                # Damage the enemy and remove the epee
-                    i.health -= BULLET_DAMAGE
-                    epee.remove_from_sprite_lists()
+        self.send_input(INPUT_KEY_PRESS, key)
 
-                # Set the player's indicator bar fullness
-                    i.indicator_bar.fullness = (
-                        i.health / ENEMY_HEALTH
-                    )
+    def on_key_release(self, key, modifiers):
+        """Called when the user releases a key. """
+        self.send_input(INPUT_KEY_RELEASE, key)
 
-                # Hit Sound
-                    arcade.play_sound(self.hit_sound)
+    def send_input(self, kind: int, code: int) -> None:
+        """Gives an input event to the game and records it. Ignored while replaying."""
+        if self.replay is not None:
+            return
+        if self.recorder is not None:
+            self.recorder.record(self.state.ticks, kind, code)
+        self.state.handle_input(kind, code)
 
-            if len(self.epee_list) > 1 or (abs(epee.center_x - self.player_sprite.center_x) > 50) or (abs(epee.center_y - self.player_sprite.center_y) > 50):
-                epee.remove_from_sprite_lists()
+    def on_update(self, delta_time):
+        """ Movement and game logic """
+        self._frame_start = time.perf_counter()
+        self.profiler.start()
+        if self.prefetcher is not None:
+            self.prefetcher.request(self.state.current_room)
+            self.prefetcher.update(self.state.current_room)
+        self.profiler.lap("prefetch")
+
+        if self.replay is not None:
+            delta_time = self.replay.apply(self.state)
+            if self.replay.done and self.replay.end_tick is not None:
+                arcade.exit()
+                return
+        elif self.recorder is not None:
+            self.recorder.record_tick(self.state.ticks, delta_time)
+
+        self.state.update(delta_time)
+
+        for name in self.state.sounds:
+            arcade.play_sound(self.sounds[name])
+        self.state.sounds.clear()
 
-        # Do some logic here to figure out what room we are in, and if we need to go
-        # to a different room.
-        if self.player_sprite.center_y > SCREEN_HEIGHT and self.current_room == 0:
-            self.current_room = 1
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_y = 0
-        elif self.player_sprite.center_y > SCREEN_HEIGHT and self.current_room == 1:
-            self.current_room = 2
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_y = 0
-        
-        elif self.player_sprite.center_y < 0 and self.current_room == 1:
-            self.current_room = 0
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_y = SCREEN_HEIGHT
-        elif self.player_sprite.center_y < 0 and self.current_room == 2:
-            self.current_room = 1
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_y = SCREEN_HEIGHT
-        
-        elif self.player_sprite.center_x > SCREEN_WIDTH and self.current_room == 1:
-            self.current_room = 3
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_x = 0
-        elif self.player_sprite.center_x < 0 and self.current_room == 3:
-            self.current_room = 1
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_x = SCREEN_WIDTH
-
-        elif self.player_sprite.center_y < 0 and self.current_room == 3:
-            self.current_room = 4
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_y = SCREEN_HEIGHT
-        elif self.player_sprite.center_y > SCREEN_HEIGHT and self.current_room == 4:
-            self.current_room = 3
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_y = 0
-
-        elif self.player_sprite.center_x > SCREEN_WIDTH and self.current_room == 3:
-            self.current_room = 5
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_x = 0
-        elif self.player_sprite.center_x < 0 and self.current_room == 5:
-            self.current_room = 3
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_x = SCREEN_WIDTH
-
-        elif self.player_sprite.center_x > SCREEN_WIDTH and self.current_room == 5:
-            self.current_room = 6
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_x = 0
-        elif self.player_sprite.center_x < 0 and self.current_room == 6:
-            self.current_room = 5
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_x = SCREEN_WIDTH
-
-        elif self.player_sprite.center_y > SCREEN_HEIGHT and self.current_room == 5:
-            self.current_room = 7
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_y = 0
-        elif self.player_sprite.center_y < 0 and self.current_room == 7:
-            self.current_room = 5
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_y = SCREEN_HEIGHT
-
-        elif self.player_sprite.center_x < 0 and self.current_room == 7:
-            self.current_room = 8
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_x = SCREEN_WIDTH
-        elif self.player_sprite.center_x > SCREEN_WIDTH and self.current_room == 8:
-            self.current_room = 7
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_x = 0
-
-        elif self.player_sprite.center_y > SCREEN_HEIGHT and self.current_room == 3:
-            self.current_room = 8
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_y = 0
-        elif self.player_sprite.center_y < 0 and self.current_room == 8:
-            self.current_room = 3
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_y = SCREEN_HEIGHT
-
-        elif self.player_sprite.center_y > SCREEN_HEIGHT and self.current_room == 7:
-            self.current_room = 9
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_y = 0
-        elif self.player_sprite.center_y < 0 and self.current_room == 9:
-            self.current_room = 7
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_y = SCREEN_HEIGHT
-
-        elif self.player_sprite.center_x < 0 and self.current_room == 9:
-            self.current_room = 10
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_x = SCREEN_WIDTH
-        elif self.player_sprite.center_x > SCREEN_WIDTH and self.current_room == 10:
-            self.current_room = 9
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_x = 0
-
-        elif self.player_sprite.center_y > SCREEN_HEIGHT and self.current_room == 10:
-            self.current_room = 0
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_y = SCREEN_HEIGHT/2
-
-        elif self.player_sprite.center_x < 0 and self.current_room == 10:
-            self.current_room = 11
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_x = SCREEN_WIDTH
-        elif self.player_sprite.center_x > SCREEN_WIDTH and self.current_room == 11:
-            self.current_room = 10
-            self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.rooms[self.current_room].wall_list)
-            self.player_sprite.center_x = 0
+        # Check if the player is dead. If so, exit the game
+        if self.state.game_over:
+            arcade.exit()
 
 def main():
     """ Main function """
-    window = MyGame(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE)
+    parser = argparse.ArgumentParser(description=SCREEN_TITLE)
+    parser.add_argument("--seed", type=int, help="seed of the random streams, the same seed gives the same game")
+    parser.add_argument("--profile-csv", metavar="PATH", help="write the timings of every frame's stages to a CSV file")
+    parser.add_argument("--record", metavar="PATH", help="write the input of the session to a file")
+    parser.add_argument("--replay", metavar="PATH", help="play back a file written with --record, see benchmarks/replay.py to do it headless")
+    args = parser.parse_args()
+
+    # A recording is replayed with the seed it was made with
+    replay = InputReplay(args.replay) if args.replay else None
+    seed = replay.seed if replay is not None else args.seed
+
+    window = MyGame(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE, seed, args.profile_csv, args.record, replay)
+    print("Seed:", window.state.random.seed)
     window.setup()
     arcade.run()
+    if window.prefetcher is not None:
+        window.prefetcher.shutdown()
+    if window.recorder is not None:
+        window.recorder.close(window.state.ticks)
+    window.profiler.close()
+    print(window.frame_times)
+    print("Bullets:", window.state.bullet_pool.stats())
 
 class MyView(arcade.View):
     def __init__(self, my_window: arcade.Window):